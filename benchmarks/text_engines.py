@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Compare the text extraction engines of pdf_extract_text
+
+For every PDF given, each engine extracts every page (with and without
+layout preservation) and the script prints its throughput in pages per
+second and how close its output is to pdfplumber's, as the word-level
+similarity ratio of the two texts (1.0 means the same words in the same
+order).
+
+Usage: python benchmarks/text_engines.py document.pdf [more.pdf ...]
+"""
+
+import argparse
+import difflib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.text_extract import ENGINES, PdfplumberEngine, open_engine
+
+REFERENCE_ENGINE = PdfplumberEngine.name
+
+
+def extract_all(engine, pdf_path, layout):
+    """Extract every page; returns the page texts and the seconds it took"""
+    start = time.perf_counter()
+    with open_engine(engine, pdf_path) as document:
+        page_indices = list(range(document.page_count()))
+        texts = list(document.pages_text(page_indices, layout))
+    return texts, time.perf_counter() - start
+
+
+def similarity(texts, reference_texts):
+    """Word-level similarity of two extractions, averaged over pages"""
+    if not reference_texts:
+        return 1.0
+    ratios = []
+    for text, reference in zip(texts, reference_texts):
+        matcher = difflib.SequenceMatcher(None, text.split(), reference.split(), autojunk=False)
+        ratios.append(matcher.ratio())
+    return sum(ratios) / len(ratios)
+
+
+def benchmark(pdf_path, engines):
+    print(f"\n{pdf_path}")
+    print(f"{'engine':<12} {'layout':<7} {'pages':>6} {'seconds':>9} {'pages/s':>9} {'parity':>7}")
+    for layout in (False, True):
+        reference_texts = None
+        for engine in sorted(engines, key=lambda name: name != REFERENCE_ENGINE):
+            try:
+                texts, seconds = extract_all(engine, pdf_path, layout)
+            except Exception as e:
+                print(f"{engine:<12} {str(layout):<7} failed: {e}")
+                continue
+            if engine == REFERENCE_ENGINE:
+                reference_texts = texts
+            parity = f"{similarity(texts, reference_texts):.3f}" if reference_texts is not None else "-"
+            rate = len(texts) / seconds if seconds > 0 else float("inf")
+            print(f"{engine:<12} {str(layout):<7} {len(texts):>6} {seconds:>9.2f} {rate:>9.1f} {parity:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf_paths", nargs="+", help="PDF files to extract")
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=sorted(ENGINES),
+        default=sorted(ENGINES),
+        help="engines to compare (default: all)",
+    )
+    args = parser.parse_args()
+
+    for pdf_path in args.pdf_paths:
+        benchmark(pdf_path, args.engines)
+
+
+if __name__ == "__main__":
+    main()
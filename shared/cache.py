@@ -0,0 +1,55 @@
+"""Locations, keys and writes for the on-disk caches shared by the blocks"""
+
+import os
+import hashlib
+import tempfile
+
+# Overrides the cache root (defaults to $XDG_CACHE_HOME/oomol-pdf)
+CACHE_DIR_ENV = "PDF_CACHE_DIR"
+
+_digests: dict[tuple[str, int, int], str] = {}
+
+
+def cache_dir(namespace: str) -> str:
+    """Return (and create) the cache directory for one kind of cached data"""
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        xdg_cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        root = os.path.join(xdg_cache, "oomol-pdf")
+    path = os.path.join(root, namespace)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_digest(path: str) -> str:
+    """
+    SHA-256 of a file's content, memoized per process on (path, size, mtime)
+    so repeated lookups of an unchanged file don't re-read it
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+def cache_key(*parts) -> str:
+    """Combine key parts into a file-name safe hex key"""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write a cache entry so concurrent readers never see a partial file"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,133 @@
+"""
+Merge identical indirect objects of a PdfWriter before it is written
+
+Documents generated from the same template carry byte-identical fonts,
+images and content streams. Each is hashed on its serialized form (stream
+data hashed once, dictionaries with their references) and every duplicate is
+dropped in favour of its first copy, with all references rewritten. Replacing
+leaves makes their parents identical too, so passes repeat until nothing
+changes: a font descriptor is merged once its font file has been, a font
+once its descriptor has been, and so on up the graph.
+
+Page objects themselves are never merged (a page must appear once in the
+page tree), but identical pages end up sharing all their content and
+resources, leaving only their small page dictionaries.
+"""
+
+import io
+import hashlib
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+
+def is_page(obj) -> bool:
+    return isinstance(obj, DictionaryObject) and obj.get("/Type") == "/Page"
+
+
+def _serialize(obj) -> bytes:
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer)
+    return buffer.getvalue()
+
+
+def stream_digest(stream: StreamObject) -> bytes:
+    """Digest of a stream's (still encoded) data"""
+    return hashlib.sha256(stream._data).digest()
+
+
+def object_digest(obj, data_digest: bytes | None = None) -> bytes:
+    """Digest of an object's serialized form; streams are hashed as dictionary plus data digest"""
+    if isinstance(obj, StreamObject):
+        if data_digest is None:
+            data_digest = stream_digest(obj)
+        buffer = io.BytesIO()
+        DictionaryObject.write_to_stream(obj, buffer)
+        return hashlib.sha256(b"stream" + buffer.getvalue() + data_digest).digest()
+    return hashlib.sha256(type(obj).__name__.encode() + _serialize(obj)).digest()
+
+
+def replace_references(obj, replacements: dict[int, IndirectObject]):
+    """Point references to merged objects at their surviving copy, recursing into direct containers"""
+    if isinstance(obj, DictionaryObject):
+        items = obj.items()
+    elif isinstance(obj, ArrayObject):
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in list(items):
+        if isinstance(value, IndirectObject):
+            if value.idnum in replacements:
+                obj[key] = replacements[value.idnum]
+        else:
+            replace_references(value, replacements)
+
+
+class Deduplicator:
+    """
+    Merges identical objects of one writer, possibly batch by batch: objects
+    of a later batch are also merged into surviving copies from earlier ones,
+    which may already have been written out and released
+    """
+
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+        self.first_copies: dict[bytes, int] = {}
+        self.removed = 0
+        self.bytes_saved = 0
+
+    def run(self, indices) -> dict[int, IndirectObject]:
+        """
+        Merge the objects at `indices` (0-based) into each other and into
+        earlier batches. Returns the surviving copy of every removed object by
+        object number, for references held outside the writer.
+
+        Objects of earlier batches can't refer to objects added after them, so
+        references are only rewritten inside the batch (including its pages).
+        """
+        objects = self.writer._objects
+        indices = [index for index in indices if objects[index] is not None]
+        pages = [index for index in indices if is_page(objects[index])]
+        indices = [index for index in indices if not is_page(objects[index])]
+        data_digests = {
+            index: stream_digest(objects[index])
+            for index in indices
+            if isinstance(objects[index], StreamObject)
+        }
+        merged: dict[int, IndirectObject] = {}
+
+        while True:
+            batch_copies: dict[bytes, int] = {}
+            replacements: dict[int, IndirectObject] = {}
+            for index in indices:
+                digest = object_digest(objects[index], data_digests.get(index))
+                first = self.first_copies.get(digest)
+                if first is None:
+                    first = batch_copies.setdefault(digest, index)
+                if first != index:
+                    replacements[index + 1] = IndirectObject(first + 1, 0, self.writer)
+
+            if not replacements:
+                # Surviving objects are final now, later batches merge into them
+                self.first_copies.update(batch_copies)
+                return merged
+
+            for idnum in replacements:
+                self.bytes_saved += len(_serialize(objects[idnum - 1]))
+                objects[idnum - 1] = None
+            self.removed += len(replacements)
+            # A survivor of an earlier pass may have been merged in this one
+            merged = {idnum: replacements.get(ref.idnum, ref) for idnum, ref in merged.items()}
+            merged.update(replacements)
+            indices = [index for index in indices if index + 1 not in replacements]
+            for index in indices + pages:
+                replace_references(objects[index], replacements)
+
+
+def deduplicate_objects(writer: PdfWriter) -> tuple[int, int]:
+    """
+    Merge identical indirect objects in place, returning the number of objects
+    removed and the bytes their serialized bodies would have taken
+    """
+    deduplicator = Deduplicator(writer)
+    deduplicator.run(range(len(writer._objects)))
+    return deduplicator.removed, deduplicator.bytes_saved
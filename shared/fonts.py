@@ -0,0 +1,96 @@
+"""
+Process-wide discovery and registration of Unicode/CJK fonts for reportlab
+
+Parsing a TrueType collection such as wqy-microhei.ttc takes far longer than
+drawing with it, so each font file is parsed and registered with reportlab
+at most once per process. Blocks run with `spawn: false`, so the registry
+(and reportlab's parsed metrics and subsets) is reused across pages and jobs.
+"""
+
+import os
+import threading
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+# Fonts that support Chinese, Japanese and Korean, tried after any configured
+# search path. Format: (path, subfontIndex) - subfontIndex is for TTC files
+DEFAULT_FONT_CONFIGS = [
+    ('/usr/share/fonts/truetype/wqy/wqy-microhei.ttc', 0),  # WenQuanYi Micro Hei (Linux)
+    ('/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc', 0),    # WenQuanYi Zen Hei (Linux)
+    ('/System/Library/Fonts/PingFang.ttc', 0),               # macOS
+    ('C:\\Windows\\Fonts\\msyh.ttc', 0),                     # Windows - Microsoft YaHei
+    ('C:\\Windows\\Fonts\\simsun.ttc', 0),                   # Windows - SimSun
+]
+
+# Extra font files or directories, separated by os.pathsep
+FONT_PATH_ENV = "PDF_FONT_PATH"
+
+FONT_EXTENSIONS = (".ttf", ".ttc")
+
+# Used when no configured or default font can be registered
+FALLBACK_FONT = "Helvetica"
+
+_lock = threading.Lock()
+_registered: dict[tuple[str, int], str] = {}
+_failed: set[tuple[str, int]] = set()
+_resolved: dict[tuple[str, ...], str] = {}
+
+
+def font_search_path(font_dirs=None) -> tuple[str, ...]:
+    """Combine explicitly configured font locations with the PDF_FONT_PATH environment variable"""
+    search_path = [path for path in (font_dirs or []) if path]
+    search_path += [path for path in os.environ.get(FONT_PATH_ENV, "").split(os.pathsep) if path]
+    return tuple(search_path)
+
+
+def font_candidates(search_path):
+    """Yield (path, subfontIndex) candidates: configured locations first, then the defaults"""
+    for location in search_path:
+        if os.path.isfile(location):
+            yield location, 0
+        elif os.path.isdir(location):
+            for root, _, files in sorted(os.walk(location)):
+                for file_name in sorted(files):
+                    if file_name.lower().endswith(FONT_EXTENSIONS):
+                        yield os.path.join(root, file_name), 0
+    for font_path, subfont_idx in DEFAULT_FONT_CONFIGS:
+        if os.path.exists(font_path):
+            yield font_path, subfont_idx
+
+
+def register_font(font_path: str, subfont_idx: int = 0) -> str | None:
+    """Register a font file with reportlab once, returning its font name (None if unusable)"""
+    key = (os.path.abspath(font_path), subfont_idx)
+    with _lock:
+        if key in _registered:
+            return _registered[key]
+        if key in _failed:
+            return None
+        font_name = f"CJKFont{len(_registered)}"
+        try:
+            pdfmetrics.registerFont(TTFont(font_name, font_path, subfontIndex=subfont_idx))
+        except Exception:
+            _failed.add(key)
+            return None
+        _registered[key] = font_name
+        return font_name
+
+
+def resolve_font(font_dirs=None) -> str:
+    """
+    Return the name of a registered Unicode font found on the search path,
+    falling back to Helvetica. Discovery runs once per distinct search path.
+    """
+    search_path = font_search_path(font_dirs)
+    if search_path in _resolved:
+        return _resolved[search_path]
+
+    font_name = FALLBACK_FONT
+    for font_path, subfont_idx in font_candidates(search_path):
+        registered = register_font(font_path, subfont_idx)
+        if registered is not None:
+            font_name = registered
+            break
+
+    _resolved[search_path] = font_name
+    return font_name
@@ -0,0 +1,129 @@
+"""
+Write a PdfWriter's objects to the output file while the document is built
+
+PdfWriter keeps every object in memory until `write`. When pages are copied
+in from many inputs, the objects of a finished input (content streams,
+fonts, images) never change again, so they can be serialized right away and
+dropped from the writer. The page dictionaries, the page tree and the other
+objects the writer itself manages stay in memory, since later steps
+(outlines, the page tree's /Kids) still refer to or modify them; they are
+written together with the cross-reference table by `finish`.
+"""
+
+from typing import BinaryIO, Iterator
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+from shared.dedupe import Deduplicator, is_page
+
+
+def referenced_idnums(obj) -> Iterator[int]:
+    """Object numbers an object refers to, through its direct dictionaries and arrays"""
+    if isinstance(obj, DictionaryObject):
+        values = obj.values()
+    elif isinstance(obj, ArrayObject):
+        values = obj
+    else:
+        return
+    for value in values:
+        if isinstance(value, IndirectObject):
+            yield value.idnum
+        else:
+            yield from referenced_idnums(value)
+
+
+class IncrementalWriter:
+    """Streams the objects of one PdfWriter to `output` batch by batch"""
+
+    def __init__(self, writer: PdfWriter, output: BinaryIO, deduplicate: bool = True):
+        self.writer = writer
+        self.output = output
+        self.deduplicator = Deduplicator(writer) if deduplicate else None
+        self._offsets: dict[int, int] = {}
+        # Objects the writer created for itself (catalog, page tree, info)
+        # are kept until the end
+        self._kept = set(range(len(writer._objects)))
+        self._next = len(writer._objects)
+
+        header = writer.pdf_header
+        if isinstance(header, str):
+            header = header.encode()
+        output.write(header + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.deduplicator.bytes_saved if self.deduplicator else 0
+
+    def _write_object(self, index: int, obj):
+        idnum = index + 1
+        self._offsets[idnum] = self.output.tell()
+        self.output.write(f"{idnum} 0 obj\n".encode())
+        obj.write_to_stream(self.output)
+        self.output.write(b"\nendobj\n")
+
+    def flush(self) -> dict[int, IndirectObject]:
+        """
+        Write and release every object added since the last flush, except
+        pages. Returns the surviving copy of every object merged away by
+        deduplication, by object number: references to them held outside the
+        writer (cached resources) have to be switched over.
+        """
+        objects = self.writer._objects
+        batch = range(self._next, len(objects))
+        merged = self.deduplicator.run(batch) if self.deduplicator is not None else {}
+        for index in batch:
+            obj = objects[index]
+            if obj is None:
+                continue
+            if is_page(obj):
+                self._kept.add(index)
+                continue
+            self._write_object(index, obj)
+            objects[index] = None
+        self._next = len(objects)
+        return merged
+
+    def finish(self):
+        """
+        Write the remaining objects, the cross-reference table and the
+        trailer. Raises ValueError if a remaining object still refers to an
+        object that deduplication dropped, rather than writing a broken file.
+        """
+        objects = self.writer._objects
+        remaining = [
+            index
+            for index in sorted(self._kept) + list(range(self._next, len(objects)))
+            if objects[index] is not None
+        ]
+        for index in remaining:
+            self._write_object(index, objects[index])
+        for index in remaining:
+            missing = [
+                idnum for idnum in referenced_idnums(objects[index])
+                if idnum not in self._offsets and (idnum > len(objects) or objects[idnum - 1] is None)
+            ]
+            if missing:
+                raise ValueError(f"Object {index + 1} refers to dropped objects {missing}")
+
+        size = len(objects) + 1
+        free = [idnum for idnum in range(1, size) if idnum not in self._offsets]
+        next_free = dict(zip([0] + free, free + [0]))
+
+        xref_offset = self.output.tell()
+        self.output.write(f"xref\n0 {size}\n".encode())
+        self.output.write(f"{next_free[0]:010d} 65535 f \n".encode())
+        for idnum in range(1, size):
+            if idnum in self._offsets:
+                self.output.write(f"{self._offsets[idnum]:010d} 00000 n \n".encode())
+            else:
+                self.output.write(f"{next_free[idnum]:010d} 00001 f \n".encode())
+
+        trailer = DictionaryObject({
+            NameObject("/Size"): NumberObject(size),
+            NameObject("/Root"): self.writer.root_object.indirect_reference,
+        })
+        info = self.writer._info
+        if info is not None:
+            trailer[NameObject("/Info")] = info if isinstance(info, IndirectObject) else info.indirect_reference
+        self.output.write(b"trailer\n")
+        trailer.write_to_stream(self.output)
+        self.output.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
@@ -0,0 +1,89 @@
+"""
+Resolve outline (bookmark) destinations to page indices
+
+An outline destination points at a page object, and its object number says
+nothing about where the page sits in the document. `page_index_map` indexes
+every page of a reader once by object number, so each destination then
+resolves with a single dict lookup instead of a search through the pages.
+
+`outline_tree` turns pypdf's flat "item followed by a list of its children"
+outline into plain nodes holding titles and page indices, which stay valid
+(and picklable) after the reader is closed.
+"""
+
+from dataclasses import dataclass, field
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import IndirectObject, NumberObject
+
+
+@dataclass
+class OutlineNode:
+    title: str
+    page_index: int | None
+    children: list["OutlineNode"] = field(default_factory=list)
+
+
+def page_index_map(reader: PdfReader) -> dict[int, int]:
+    """Map the object number of every page to its 0-based page index"""
+    return {
+        page.indirect_reference.idnum: index
+        for index, page in enumerate(reader.pages)
+        if page.indirect_reference is not None
+    }
+
+
+def destination_page_index(destination, index_map: dict[int, int]) -> int | None:
+    """Page index an outline item points to, or None if it doesn't point into the document"""
+    try:
+        page = destination.page
+    except Exception:
+        return None
+    if isinstance(page, IndirectObject):
+        return index_map.get(page.idnum)
+    if isinstance(page, (int, NumberObject)):
+        # Some writers store the page index itself
+        index = int(page)
+        return index if 0 <= index < len(index_map) else None
+    return None
+
+
+def outline_tree(reader: PdfReader, index_map: dict[int, int] | None = None) -> list[OutlineNode]:
+    """The reader's outline as nested nodes with resolved page indices"""
+    if index_map is None:
+        index_map = page_index_map(reader)
+
+    def build(items) -> list[OutlineNode]:
+        nodes = []
+        for item in items:
+            if isinstance(item, list):
+                children = build(item)
+                if nodes:
+                    nodes[-1].children.extend(children)
+                else:
+                    nodes.extend(children)
+            else:
+                nodes.append(OutlineNode(str(item.title), destination_page_index(item, index_map)))
+        return nodes
+
+    return build(reader.outline)
+
+
+def outline_page_indices(nodes: list[OutlineNode]) -> list[int]:
+    """Sorted, distinct page indices of every node in the tree"""
+    pages = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node.page_index is not None:
+            pages.add(node.page_index)
+        stack.extend(node.children)
+    return sorted(pages)
+
+
+def add_outline(writer: PdfWriter, nodes: list[OutlineNode], page_offset: int = 0, parent=None):
+    """Add outline nodes (keeping their hierarchy) to a writer whose pages start at `page_offset`"""
+    for node in nodes:
+        page_number = None if node.page_index is None else page_offset + node.page_index
+        item = writer.add_outline_item(node.title, page_number, parent)
+        if node.children:
+            add_outline(writer, node.children, page_offset, item)
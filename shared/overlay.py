@@ -0,0 +1,343 @@
+"""
+Lightweight overlay engine emitting PDF content streams directly
+
+Drawing an overlay with a reportlab canvas means serializing a whole PDF,
+parsing it back with PdfReader and merging its first page. For the simple
+overlays the blocks draw (text in the standard fonts, rectangles, circles,
+images, transforms and transparency) the content-stream operators can be
+written directly instead, and the resources they need built once per output
+document as pypdf objects.
+
+`Overlay` records operators and the resources they use. `OverlayEngine`
+turns overlays into page content (or Form XObjects) inside one PdfWriter,
+sharing fonts, graphics states and images across every page it stamps.
+"""
+
+import math
+import hashlib
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+)
+from shared.pdf_images import ImagePayload, image_xobject
+
+# The standard 14 fonts need no embedding; text is encoded as WinAnsi
+STANDARD_FONTS = {
+    "Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique",
+    "Times-Roman", "Times-Bold", "Times-Italic", "Times-BoldItalic",
+    "Courier", "Courier-Bold", "Courier-Oblique", "Courier-BoldOblique",
+    "Symbol", "ZapfDingbats",
+}
+TEXT_ENCODING = "cp1252"
+
+# Bezier control point distance for a quarter circle
+KAPPA = 0.5522847498
+
+
+def _num(value) -> str:
+    """Format a number the short way PDF operators expect"""
+    text = f"{float(value):.4f}".rstrip("0").rstrip(".")
+    return text if text not in ("", "-0") else "0"
+
+
+def _escape(data: bytes) -> bytes:
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r")
+
+
+def can_encode(text: str) -> bool:
+    """Whether `text` can be drawn with the standard fonts"""
+    try:
+        text.encode(TEXT_ENCODING)
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def text_width(text: str, font: str = "Helvetica", size: float = 12) -> float:
+    """Width of `text` in points, from the standard font metrics"""
+    return stringWidth(text, font, size)
+
+
+class Overlay:
+    """Content-stream operators plus the fonts, alpha states and images they use"""
+
+    def __init__(self):
+        self._operators: list[bytes] = []
+        self.fonts: set[str] = set()
+        self.gstates: set[tuple[float | None, float | None]] = set()
+        self.images: dict[str, tuple[ImagePayload, ImagePayload | None]] = {}
+        self._font = ("Helvetica", 12.0)
+
+    def _emit(self, *parts):
+        self._operators.append(b" ".join(part if isinstance(part, bytes) else part.encode() for part in parts))
+
+    @property
+    def empty(self) -> bool:
+        return not self._operators
+
+    # Graphics state
+
+    def save_state(self):
+        self._emit("q")
+
+    def restore_state(self):
+        self._emit("Q")
+
+    def transform(self, a, b, c, d, e, f):
+        self._emit(*(_num(value) for value in (a, b, c, d, e, f)), "cm")
+
+    def translate(self, x, y):
+        self.transform(1, 0, 0, 1, x, y)
+
+    def rotate(self, degrees):
+        radians = math.radians(degrees)
+        cos, sin = math.cos(radians), math.sin(radians)
+        self.transform(cos, sin, -sin, cos, 0, 0)
+
+    def set_fill_color(self, red, green, blue):
+        self._emit(_num(red), _num(green), _num(blue), "rg")
+
+    def set_stroke_color(self, red, green, blue):
+        self._emit(_num(red), _num(green), _num(blue), "RG")
+
+    def set_alpha(self, fill=None, stroke=None):
+        """Set fill and/or stroke transparency through an ExtGState"""
+        key = (fill, stroke)
+        self.gstates.add(key)
+        self._emit(gstate_name(key), "gs")
+
+    def set_font(self, font: str, size: float):
+        if font not in STANDARD_FONTS:
+            raise ValueError(f"Not a standard PDF font: {font}")
+        self._font = (font, float(size))
+
+    # Painting
+
+    def _paint(self, fill, stroke):
+        if fill and stroke:
+            self._emit("B")
+        elif fill:
+            self._emit("f")
+        elif stroke:
+            self._emit("S")
+        else:
+            self._emit("n")
+
+    def rect(self, x, y, width, height, fill=True, stroke=False):
+        self._emit(_num(x), _num(y), _num(width), _num(height), "re")
+        self._paint(fill, stroke)
+
+    def circle(self, x, y, radius, fill=True, stroke=False):
+        k = radius * KAPPA
+        self._emit(_num(x + radius), _num(y), "m")
+        for points in (
+            (x + radius, y + k, x + k, y + radius, x, y + radius),
+            (x - k, y + radius, x - radius, y + k, x - radius, y),
+            (x - radius, y - k, x - k, y - radius, x, y - radius),
+            (x + k, y - radius, x + radius, y - k, x + radius, y),
+        ):
+            self._emit(*(_num(value) for value in points), "c")
+        self._paint(fill, stroke)
+
+    def text(self, x, y, text: str, align: str = "left"):
+        """Draw one line of text with the current font; `align` is left, center or right"""
+        font, size = self._font
+        if align != "left":
+            width = text_width(text, font, size)
+            x -= width / 2 if align == "center" else width
+        self.fonts.add(font)
+        self._emit(
+            "BT",
+            font_name(font), _num(size), "Tf",
+            _num(x), _num(y), "Td",
+            b"(" + _escape(text.encode(TEXT_ENCODING, errors="replace")) + b")", "Tj",
+            "ET",
+        )
+
+    def image(self, payload: ImagePayload, x, y, width, height, smask: ImagePayload | None = None):
+        """Draw an image XObject (with an optional soft mask) into the given box"""
+        digest = hashlib.sha1(payload.data)
+        if smask is not None:
+            digest.update(smask.data)
+        name = f"/OOIm{digest.hexdigest()[:16]}"
+        self.images[name] = (payload, smask)
+        self._emit("q", _num(width), "0 0", _num(height), _num(x), _num(y), "cm", name, "Do", "Q")
+
+    def content(self) -> bytes:
+        """The overlay's operators, isolated in their own graphics state"""
+        return b"q\n" + b"\n".join(self._operators) + b"\nQ\n"
+
+
+def font_name(font: str) -> str:
+    return f"/OO{font}"
+
+
+def gstate_name(key) -> str:
+    fill, stroke = key
+    fill_part = "n" if fill is None else str(round(fill * 1000))
+    stroke_part = "n" if stroke is None else str(round(stroke * 1000))
+    return f"/OOGS{fill_part}_{stroke_part}"
+
+
+class OverlayEngine:
+    """Stamps overlays onto pages of one PdfWriter, sharing every resource it creates"""
+
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+        self._fonts: dict[str, IndirectObject] = {}
+        self._gstates: dict[tuple, IndirectObject] = {}
+        self._images: dict[str, IndirectObject] = {}
+        self._streams: dict[bytes, IndirectObject] = {}
+
+    def remap(self, merged: dict[int, IndirectObject]):
+        """Switch cached resources that were merged into identical objects over to the surviving copy"""
+        for cache in (self._fonts, self._gstates, self._images, self._streams):
+            for key, ref in cache.items():
+                if ref.idnum in merged:
+                    cache[key] = merged[ref.idnum]
+
+    def content_stream(self, data: bytes, shared: bool = False) -> IndirectObject:
+        """Add a content stream to the writer; `shared` streams are added once per content"""
+        if shared and data in self._streams:
+            return self._streams[data]
+        stream = DecodedStreamObject()
+        stream.set_data(data)
+        if len(data) > 256:
+            stream = stream.flate_encode()
+        ref = self.writer._add_object(stream)
+        if shared:
+            self._streams[data] = ref
+        return ref
+
+    def _font_ref(self, font: str) -> IndirectObject:
+        if font not in self._fonts:
+            self._fonts[font] = self.writer._add_object(DictionaryObject({
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject(f"/{font}"),
+                NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+            }))
+        return self._fonts[font]
+
+    def _gstate_ref(self, key) -> IndirectObject:
+        if key not in self._gstates:
+            fill, stroke = key
+            gstate = DictionaryObject({NameObject("/Type"): NameObject("/ExtGState")})
+            if fill is not None:
+                gstate[NameObject("/ca")] = FloatObject(fill)
+            if stroke is not None:
+                gstate[NameObject("/CA")] = FloatObject(stroke)
+            self._gstates[key] = self.writer._add_object(gstate)
+        return self._gstates[key]
+
+    def _image_ref(self, name: str, payload: ImagePayload, smask: ImagePayload | None) -> IndirectObject:
+        if name not in self._images:
+            xobject = image_xobject(payload)
+            if smask is not None:
+                xobject[NameObject("/SMask")] = self.writer._add_object(image_xobject(smask))
+            self._images[name] = self.writer._add_object(xobject)
+        return self._images[name]
+
+    def resources(self, overlay: Overlay) -> dict[str, dict[str, IndirectObject]]:
+        """Resource entries the overlay needs, by category"""
+        return {
+            "/Font": {font_name(font): self._font_ref(font) for font in overlay.fonts},
+            "/ExtGState": {gstate_name(key): self._gstate_ref(key) for key in overlay.gstates},
+            "/XObject": {
+                name: self._image_ref(name, payload, smask)
+                for name, (payload, smask) in overlay.images.items()
+            },
+        }
+
+    def add_resources(self, page, resources: dict[str, dict[str, IndirectObject]]):
+        """Merge resource entries into a page (or form) resource dictionary"""
+        if "/Resources" not in page:
+            page[NameObject("/Resources")] = DictionaryObject()
+        page_resources = page["/Resources"].get_object()
+        for category, entries in resources.items():
+            if not entries:
+                continue
+            if category not in page_resources:
+                page_resources[NameObject(category)] = DictionaryObject()
+            category_dict = page_resources[category].get_object()
+            for name, ref in entries.items():
+                category_dict[NameObject(name)] = ref
+
+    def wrap_contents(self, page, before: list[IndirectObject], after: list[IndirectObject]):
+        """Put content streams around a page's existing ones, by reference and without decoding them"""
+        parts = []
+        if "/Contents" in page:
+            raw_contents = page.raw_get("/Contents")
+            contents = raw_contents.get_object()
+            if isinstance(contents, ArrayObject):
+                parts = list(contents)
+            elif isinstance(raw_contents, IndirectObject):
+                parts = [raw_contents]
+            else:
+                parts = [self.writer._add_object(contents)]
+        page[NameObject("/Contents")] = ArrayObject(before + parts + after)
+
+    def apply(self, page, overlay: Overlay, over: bool = True):
+        """
+        Stamp an overlay onto a page already added to the writer. Foreground
+        overlays are drawn after the page content (which is isolated in its
+        own graphics state), background ones before it.
+        """
+        if overlay.empty:
+            return
+        self.add_resources(page, self.resources(overlay))
+        stream = self.content_stream(overlay.content())
+        if over:
+            self.wrap_contents(
+                page,
+                [self.content_stream(b"q\n", shared=True)],
+                [self.content_stream(b"\nQ\n", shared=True), stream],
+            )
+        else:
+            self.wrap_contents(page, [stream], [])
+
+    def _form(self, content: bytes, width, height, resources) -> IndirectObject:
+        form = DecodedStreamObject()
+        form.set_data(content)
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject([
+                FloatObject(0), FloatObject(0), FloatObject(width), FloatObject(height),
+            ]),
+        })
+        if resources is not None:
+            form[NameObject("/Resources")] = resources
+        return self.writer._add_object(form.flate_encode())
+
+    def form_xobject(self, overlay: Overlay, width, height) -> IndirectObject:
+        """Write an overlay once as a Form XObject covering (0, 0, width, height)"""
+        form_resources = DictionaryObject()
+        holder = DictionaryObject({NameObject("/Resources"): form_resources})
+        self.add_resources(holder, self.resources(overlay))
+        return self._form(overlay.content(), width, height, form_resources)
+
+    def form_from_page(self, page, width, height) -> IndirectObject:
+        """Write a page from another document (e.g. a rendered overlay) once as a Form XObject"""
+        contents = page.get_contents()
+        resources = page.raw_get("/Resources").clone(self.writer) if "/Resources" in page else None
+        return self._form(contents.get_data() if contents is not None else b"", width, height, resources)
+
+    def stamp_form(self, page, name: str, form_ref: IndirectObject, over: bool = True):
+        """Draw a shared Form XObject on a page with a single `Do` operator"""
+        self.add_resources(page, {"/XObject": {name: form_ref}})
+        draw = self.content_stream(f"q {name} Do Q\n".encode(), shared=True)
+        if over:
+            self.wrap_contents(
+                page,
+                [self.content_stream(b"q\n", shared=True)],
+                [self.content_stream(b"\nQ\n", shared=True), draw],
+            )
+        else:
+            self.wrap_contents(page, [draw], [])
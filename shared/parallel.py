@@ -0,0 +1,28 @@
+"""Helpers for running per-item work on a pool while keeping results in order"""
+
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_in_flight: int,
+) -> Iterator[R]:
+    """
+    Like executor.map, but yields results in input order while never having
+    more than `max_in_flight` submitted-but-unconsumed items at a time, so the
+    memory held by finished results stays bounded however long `items` is.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,328 @@
+"""
+Build PDF image pages directly as pypdf objects
+
+Encoded image data (JPEG files, PNG IDAT streams) can be embedded in a PDF
+as-is: JPEG is a valid /DCTDecode stream and PNG image data is a valid
+/FlateDecode stream with a PNG predictor. Embedding it directly skips the
+decode and re-encode PIL would otherwise do. Images that have to be decoded
+are encoded once, in memory, and added the same way, so no intermediate PDF
+is ever written or parsed. Scans that turn out to be grayscale or pure
+black-and-white are stored as 8-bit or 1-bit gray instead of 24-bit RGB.
+"""
+
+import io
+import struct
+import zlib
+from dataclasses import dataclass
+from PIL import Image, ImageChops, UnidentifiedImageError
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    ByteStringObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+    PdfObject,
+)
+
+# Resolution used to turn pixels into page size (same as the PIL PDF writer
+# was given before)
+DEFAULT_DPI = 100.0
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+JPEG_COLORSPACES = {
+    "L": "/DeviceGray",
+    "RGB": "/DeviceRGB",
+    "CMYK": "/DeviceCMYK",
+}
+
+
+@dataclass
+class ImagePayload:
+    """Encoded pixel data plus everything needed to describe it as an XObject"""
+    width: int
+    height: int
+    data: bytes
+    filter: str | None
+    color_space: PdfObject
+    bits_per_component: int = 8
+    decode_parms: DictionaryObject | None = None
+    decode: list[float] | None = None
+
+
+def jpeg_payload(image_path: str) -> ImagePayload | None:
+    """Wrap a JPEG file as a /DCTDecode payload, or None if it can't be embedded as-is"""
+    with Image.open(image_path) as image:
+        if image.format != "JPEG" or image.mode not in JPEG_COLORSPACES:
+            return None
+        width, height = image.size
+        mode = image.mode
+        adobe = "adobe" in image.info
+
+    with open(image_path, "rb") as file:
+        data = file.read()
+
+    decode = None
+    if mode == "CMYK" and adobe:
+        # Adobe writes CMYK JPEGs inverted
+        decode = [1, 0] * 4
+
+    return ImagePayload(
+        width=width,
+        height=height,
+        data=data,
+        filter="/DCTDecode",
+        color_space=NameObject(JPEG_COLORSPACES[mode]),
+        decode=decode,
+    )
+
+
+def png_payload(image_path: str) -> ImagePayload | None:
+    """Wrap a PNG file's IDAT data as a /FlateDecode payload, or None if it can't be embedded as-is"""
+    with open(image_path, "rb") as file:
+        if file.read(8) != PNG_SIGNATURE:
+            return None
+        header = None
+        palette = None
+        idat = []
+        while True:
+            chunk_header = file.read(8)
+            if len(chunk_header) < 8:
+                return None
+            length, chunk_type = struct.unpack(">I4s", chunk_header)
+            chunk = file.read(length)
+            file.read(4)  # CRC
+            if chunk_type == b"IHDR":
+                header = struct.unpack(">IIBBBBB", chunk)
+            elif chunk_type == b"PLTE":
+                palette = chunk
+            elif chunk_type == b"IDAT":
+                idat.append(chunk)
+            elif chunk_type == b"tRNS":
+                # Transparency would need a soft mask, let PIL handle it
+                return None
+            elif chunk_type == b"IEND":
+                break
+
+    if header is None or not idat:
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if interlace != 0:
+        return None
+    if bit_depth == 16:
+        # 16 bits per component need PDF 1.5, pypdf writes 1.3 files
+        return None
+
+    if color_type == 0:
+        colors = 1
+        color_space: PdfObject = NameObject("/DeviceGray")
+    elif color_type == 2:
+        colors = 3
+        color_space = NameObject("/DeviceRGB")
+    elif color_type == 3 and palette is not None:
+        colors = 1
+        color_space = ArrayObject([
+            NameObject("/Indexed"),
+            NameObject("/DeviceRGB"),
+            NumberObject(len(palette) // 3 - 1),
+            ByteStringObject(palette),
+        ])
+    else:
+        # Gray + alpha and RGBA need a soft mask
+        return None
+
+    decode_parms = DictionaryObject({
+        NameObject("/Predictor"): NumberObject(15),
+        NameObject("/Colors"): NumberObject(colors),
+        NameObject("/BitsPerComponent"): NumberObject(bit_depth),
+        NameObject("/Columns"): NumberObject(width),
+    })
+    return ImagePayload(
+        width=width,
+        height=height,
+        data=b"".join(idat),
+        filter="/FlateDecode",
+        color_space=color_space,
+        bits_per_component=bit_depth,
+        decode_parms=decode_parms,
+    )
+
+
+def passthrough_payload(image_path: str) -> ImagePayload | None:
+    """Return a payload embedding the file's encoded data unchanged, if its format allows it"""
+    with open(image_path, "rb") as file:
+        magic = file.read(8)
+    if magic.startswith(b"\xff\xd8"):
+        return jpeg_payload(image_path)
+    if magic == PNG_SIGNATURE:
+        return png_payload(image_path)
+    return None
+
+
+def eight_bit(image: Image.Image) -> Image.Image:
+    """Scale 16-bit gray (PIL's "I" modes) down to 8-bit "L"; converting clips it to white instead"""
+    if image.mode.startswith("I"):
+        return image.convert("I").point(lambda value: value / 256).convert("L")
+    return image
+
+
+def decoded_payload(image: Image.Image) -> ImagePayload:
+    """Encode a decoded image as an RGB /DCTDecode payload, as the PIL PDF writer does"""
+    image = eight_bit(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG")
+    width, height = image.size
+    return ImagePayload(
+        width=width,
+        height=height,
+        data=buffer.getvalue(),
+        filter="/DCTDecode",
+        color_space=NameObject("/DeviceRGB"),
+    )
+
+
+def gray_content(image: Image.Image) -> Image.Image | None:
+    """
+    Return the image as an "L" image if its pixels carry no color, else None.
+    The check runs on whole bands in C (channel differences and bounding
+    boxes), never per pixel in Python.
+    """
+    image = eight_bit(image)
+    if image.mode in ("1", "L"):
+        return image.convert("L")
+    if image.mode not in ("RGB", "RGBA", "P", "LA"):
+        return None
+    red, green, blue = image.convert("RGB").split()
+    if ImageChops.difference(red, green).getbbox() or ImageChops.difference(green, blue).getbbox():
+        return None
+    return red
+
+
+def compact_payload(image: Image.Image) -> ImagePayload | None:
+    """
+    Encode grayscale content as 8-bit gray and pure black-and-white content as
+    1-bit gray (both Flate compressed), or return None for color images
+    """
+    gray = gray_content(image)
+    if gray is None:
+        return None
+
+    width, height = gray.size
+    histogram = gray.histogram()
+    if sum(histogram[1:255]) == 0:
+        # Only pure black and pure white: pack to 1 bit per pixel. In PIL's
+        # "1" mode a set bit is white, which is also DeviceGray's 1.
+        data = gray.convert("1", dither=Image.Dither.NONE).tobytes()
+        bits_per_component = 1
+    else:
+        data = gray.tobytes()
+        bits_per_component = 8
+
+    return ImagePayload(
+        width=width,
+        height=height,
+        data=zlib.compress(data),
+        filter="/FlateDecode",
+        color_space=NameObject("/DeviceGray"),
+        bits_per_component=bits_per_component,
+    )
+
+
+def flate_payloads(image: Image.Image) -> tuple[ImagePayload, ImagePayload | None]:
+    """Encode a decoded image losslessly as Flate RGB, plus an alpha soft mask if it has one"""
+    image = eight_bit(image)
+    alpha = None
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        alpha = image.getchannel("A")
+    color = image.convert("RGB")
+    width, height = color.size
+
+    payload = ImagePayload(
+        width=width,
+        height=height,
+        data=zlib.compress(color.tobytes()),
+        filter="/FlateDecode",
+        color_space=NameObject("/DeviceRGB"),
+    )
+    smask = None
+    if alpha is not None:
+        smask = ImagePayload(
+            width=width,
+            height=height,
+            data=zlib.compress(alpha.tobytes()),
+            filter="/FlateDecode",
+            color_space=NameObject("/DeviceGray"),
+        )
+    return payload, smask
+
+
+def load_payload(image_path: str, passthrough: bool = True, compact: bool = True) -> ImagePayload | None:
+    """
+    Validate `image_path` and prepare its page payload, or return None if it
+    isn't a readable image. Safe to call from worker threads: PIL releases the
+    GIL while decoding and encoding.
+    """
+    try:
+        with Image.open(image_path) as image:
+            image.verify()
+        payload = passthrough_payload(image_path) if passthrough else None
+
+        # JPEG data is kept as it is (lossy content is never exactly gray),
+        # and gray passthrough data is already compact
+        is_gray = payload is not None and payload.color_space == NameObject("/DeviceGray")
+        if compact and not is_gray and (payload is None or payload.filter != "/DCTDecode"):
+            with Image.open(image_path) as image:
+                gray_payload = compact_payload(image)
+            if gray_payload is not None:
+                return gray_payload
+
+        if payload is None:
+            with Image.open(image_path) as image:
+                payload = decoded_payload(image)
+        return payload
+    except (UnidentifiedImageError, IOError):
+        return None
+
+
+def image_xobject(payload: ImagePayload) -> DecodedStreamObject:
+    """Build an image XObject stream holding the payload's data as-is"""
+    xobject = DecodedStreamObject()
+    # The payload is already encoded, it is written out byte for byte
+    xobject.set_data(payload.data)
+    xobject.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(payload.width),
+        NameObject("/Height"): NumberObject(payload.height),
+        NameObject("/ColorSpace"): payload.color_space,
+        NameObject("/BitsPerComponent"): NumberObject(payload.bits_per_component),
+    })
+    if payload.filter is not None:
+        xobject[NameObject("/Filter")] = NameObject(payload.filter)
+    if payload.decode_parms is not None:
+        xobject[NameObject("/DecodeParms")] = payload.decode_parms
+    if payload.decode is not None:
+        xobject[NameObject("/Decode")] = ArrayObject(NumberObject(value) for value in payload.decode)
+    return xobject
+
+
+def add_image_page(writer: PdfWriter, payload: ImagePayload, dpi: float = DEFAULT_DPI):
+    """Append a page sized to the image at `dpi` that shows nothing but the image"""
+    page_width = payload.width * 72.0 / dpi
+    page_height = payload.height * 72.0 / dpi
+    page = writer.add_blank_page(page_width, page_height)
+
+    image_ref = writer._add_object(image_xobject(payload))
+    content = DecodedStreamObject()
+    content.set_data(f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode())
+
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): image_ref}),
+    })
+    page[NameObject("/Contents")] = writer._add_object(content)
+    return page
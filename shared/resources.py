@@ -0,0 +1,79 @@
+"""
+Prune page resource dictionaries down to what the page content uses
+
+Many PDFs give every page the same resource dictionary holding every font
+and image of the document. Copying such a page on its own (as pdf_split
+does) drags all of them along. The names a page's content streams mention
+are collected with a plain byte scan, which is cheaper than tokenizing the
+operators and errs on the side of keeping: any name mentioned anywhere
+keeps the resource of that name.
+"""
+
+import re
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject
+
+# Resource categories that are pruned; others (color spaces, patterns,
+# shadings, properties) are small and kept whole
+PRUNED_CATEGORIES = ("/XObject", "/Font", "/ExtGState")
+
+NAME_PATTERN = re.compile(rb"/([^\s/\[\]()<>{}%]+)")
+ESCAPE_PATTERN = re.compile(rb"#([0-9A-Fa-f]{2})")
+
+
+def content_data(contents) -> bytes:
+    """Decoded data of a /Contents entry, a single stream or an array of them"""
+    contents = contents.get_object()
+    if isinstance(contents, ArrayObject):
+        return b"\n".join(part.get_object().get_data() for part in contents)
+    return contents.get_data()
+
+
+def referenced_names(data: bytes) -> set[str]:
+    """Every name mentioned in content stream data, as pypdf spells resource keys"""
+    names = set()
+    for match in NAME_PATTERN.finditer(data):
+        raw = ESCAPE_PATTERN.sub(lambda escape: bytes([int(escape.group(1), 16)]), match.group(1))
+        names.add("/" + raw.decode("latin-1"))
+    return names
+
+
+def pruned_resources(resources: DictionaryObject, data: bytes) -> DictionaryObject:
+    """A new direct resource dictionary with only the entries `data` refers to"""
+    names = referenced_names(data)
+
+    # Form XObjects without resources of their own use the page's
+    xobjects = resources.get("/XObject")
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        pending = [name for name in xobjects if name in names]
+        while pending:
+            xobject = xobjects[pending.pop()].get_object()
+            if xobject.get("/Subtype") == "/Form" and "/Resources" not in xobject:
+                found = referenced_names(xobject.get_data()) - names
+                names |= found
+                pending.extend(name for name in found if name in xobjects)
+
+    pruned = DictionaryObject()
+    for category in resources:
+        raw_entries = resources.raw_get(category)
+        if category not in PRUNED_CATEGORIES:
+            pruned[NameObject(category)] = raw_entries
+            continue
+        entries = raw_entries.get_object()
+        kept = DictionaryObject({
+            NameObject(name): entries.raw_get(name)
+            for name in entries
+            if name in names
+        })
+        if kept:
+            pruned[NameObject(category)] = kept
+    return pruned
+
+
+def prune_page_resources(page):
+    """Replace a page's /Resources with a direct dictionary of only what its content uses"""
+    if "/Resources" not in page or "/Contents" not in page:
+        return page
+    resources = page["/Resources"].get_object()
+    page[NameObject("/Resources")] = pruned_resources(resources, content_data(page["/Contents"]))
+    return page
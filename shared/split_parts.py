@@ -0,0 +1,163 @@
+"""
+Write the parts of a split PDF, serially or on a process pool
+
+Each part is a list of 0-based page indices plus its output path. Writing a
+part only reads the source, so parts are independent: pool workers open the
+source once each (in the pool initializer) and serialize their parts
+concurrently. Pool processes are started with "spawn", which is safe
+whatever threads the host process runs.
+"""
+
+import io
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from shared.resources import prune_page_resources
+
+Part = tuple[list[int], str]
+
+# Bytes each object adds besides its body ("n 0 obj", "endobj", xref entry)
+OBJECT_OVERHEAD = 40
+# Catalog, page tree, info dictionary and trailer of every part
+FILE_OVERHEAD = 1024
+
+# Pages each pool worker has to get before a pool is worth starting: a
+# spawned worker re-imports pypdf and re-opens the source first
+MIN_PAGES_PER_WORKER = 32
+
+# Source document of a pool worker, opened by `open_source`
+_source: PdfReader | None = None
+
+
+def write_part(reader: PdfReader, page_indices: list[int], output_path: str, prune: bool = False) -> str:
+    """
+    Write the given pages of `reader` to `output_path`. With `prune`, each
+    page only carries the fonts, images and graphics states its content uses.
+    """
+    writer = PdfWriter()
+    for page_index in page_indices:
+        page = reader.pages[page_index]
+        if prune:
+            prune_page_resources(page)
+        writer.add_page(page)
+    with open(output_path, "wb") as output_file:
+        writer.write(output_file)
+    return output_path
+
+
+def _object_size(obj) -> int:
+    """Serialized size of an object; stream data is counted by its encoded length, never decoded"""
+    buffer = io.BytesIO()
+    if isinstance(obj, StreamObject):
+        DictionaryObject.write_to_stream(obj, buffer)
+        return buffer.tell() + len(obj._data) + len(b"\nstream\n\nendstream")
+    obj.write_to_stream(buffer)
+    return buffer.tell()
+
+
+def page_footprint(page) -> dict[int, int]:
+    """
+    Size of every indirect object a page pulls into a part, by object number.
+    The page tree and other pages (reachable through /Parent or link
+    annotations) are not followed.
+    """
+    footprint = {}
+    stack = [page]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.idnum in footprint:
+                continue
+            resolved = obj.get_object()
+            if resolved is not page and isinstance(resolved, DictionaryObject) and resolved.get("/Type") == "/Page":
+                continue
+            footprint[obj.idnum] = _object_size(resolved) + OBJECT_OVERHEAD
+            stack.append(resolved)
+        elif isinstance(obj, DictionaryObject):
+            stack.extend(value for key, value in obj.items() if key != "/Parent")
+        elif isinstance(obj, ArrayObject):
+            stack.extend(obj)
+    if page.indirect_reference is not None:
+        footprint.setdefault(page.indirect_reference.idnum, _object_size(page) + OBJECT_OVERHEAD)
+    return footprint
+
+
+def plan_size_parts(reader: PdfReader, max_bytes: int, prune: bool = False) -> list[list[int]]:
+    """
+    Group consecutive pages into parts that stay under `max_bytes`. Sizes add
+    up incrementally: objects shared by several pages of a part (fonts,
+    images) are counted once. A page that alone exceeds the limit gets a part
+    of its own.
+    """
+    parts = []
+    pages: list[int] = []
+    counted: set[int] = set()
+    size = FILE_OVERHEAD
+    for page_index, page in enumerate(reader.pages):
+        if prune:
+            prune_page_resources(page)
+        footprint = page_footprint(page)
+        added = sum(object_size for idnum, object_size in footprint.items() if idnum not in counted)
+        if pages and size + added > max_bytes:
+            parts.append(pages)
+            pages, counted, size = [], set(), FILE_OVERHEAD
+            added = sum(footprint.values())
+        pages.append(page_index)
+        counted.update(footprint)
+        size += added
+    if pages:
+        parts.append(pages)
+    return parts
+
+
+def open_source(pdf_path: str):
+    """Pool initializer: open the source document once per worker process"""
+    global _source
+    _source = PdfReader(pdf_path)
+
+
+def write_source_part(part: Part, prune: bool = False) -> str:
+    page_indices, output_path = part
+    return write_part(_source, page_indices, output_path, prune)
+
+
+def write_parts(
+    pdf_path: str,
+    reader: PdfReader,
+    parts: list[Part],
+    workers: int = 1,
+    prune: bool = False,
+    progress: Callable[[int, int], None] | None = None,
+) -> list[str]:
+    """
+    Write every part and return their output paths in `parts` order. With
+    more than one worker the parts are written on a process pool, and
+    `progress(done, total)` is called as parts complete. Small jobs, where
+    each worker would get fewer than MIN_PAGES_PER_WORKER pages, are
+    written serially.
+    """
+    total_pages = sum(len(page_indices) for page_indices, _ in parts)
+    workers = min(workers, len(parts), total_pages // MIN_PAGES_PER_WORKER)
+    if workers <= 1:
+        for done, (page_indices, output_path) in enumerate(parts, 1):
+            write_part(reader, page_indices, output_path, prune)
+            if progress is not None:
+                progress(done, len(parts))
+        return [output_path for _, output_path in parts]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=open_source,
+        initargs=(pdf_path,),
+    ) as executor:
+        write = functools.partial(write_source_part, prune=prune)
+        futures = [executor.submit(write, part) for part in parts]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if progress is not None:
+                progress(done, len(parts))
+    return [output_path for _, output_path in parts]
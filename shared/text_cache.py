@@ -0,0 +1,102 @@
+"""
+Persistent cache of extracted page text
+
+Entries are keyed by the PDF's content hash, the page index, the engine and
+the layout flag, so a renamed or copied file still hits and an edited one
+never does. The cache is a single SQLite database under the shared cache
+directory, which keeps lookups to one indexed query per page and is safe to
+share between concurrent runs. Each entry records when it was last used;
+once the stored text exceeds the size limit, the least recently used
+entries are evicted.
+"""
+
+import os
+import sqlite3
+import time
+from shared.cache import cache_dir
+
+# Default limit on the stored text, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_text (
+    file_hash TEXT NOT NULL,
+    page_index INTEGER NOT NULL,
+    engine TEXT NOT NULL,
+    layout INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (file_hash, page_index, engine, layout)
+);
+CREATE INDEX IF NOT EXISTS page_text_last_used ON page_text (last_used);
+"""
+
+
+class PageTextCache:
+    """Extracted text of single pages, shared by every run on this machine"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, path: str | None = None):
+        self.max_bytes = max_bytes
+        self.path = path or os.path.join(cache_dir("page-text"), "page_text.sqlite3")
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        # Readers don't block the writer (and vice versa) in WAL mode
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def cached_pages(self, file_hash: str, engine: str, layout: bool) -> set[int]:
+        """Indices of the pages of one document that are cached for an engine and layout"""
+        rows = self.connection.execute(
+            "SELECT page_index FROM page_text WHERE file_hash = ? AND engine = ? AND layout = ?",
+            (file_hash, engine, int(layout)),
+        )
+        return {page_index for (page_index,) in rows}
+
+    def get(self, file_hash: str, page_index: int, engine: str, layout: bool) -> str | None:
+        key = (file_hash, page_index, engine, int(layout))
+        row = self.connection.execute(
+            "SELECT text FROM page_text WHERE file_hash = ? AND page_index = ? AND engine = ? AND layout = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute(
+            "UPDATE page_text SET last_used = ? WHERE file_hash = ? AND page_index = ? AND engine = ? AND layout = ?",
+            (time.time(),) + key,
+        )
+        return row[0]
+
+    def put(self, file_hash: str, page_index: int, engine: str, layout: bool, text: str):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO page_text VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file_hash, page_index, engine, int(layout), text, len(text.encode("utf-8")), time.time()),
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def evict(self):
+        """Drop least recently used entries until the stored text fits the size limit"""
+        (total,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM page_text").fetchone()
+        if total <= self.max_bytes:
+            return
+        cutoff = None
+        rows = self.connection.execute("SELECT last_used, size FROM page_text ORDER BY last_used")
+        for last_used, size in rows:
+            total -= size
+            cutoff = last_used
+            if total <= self.max_bytes:
+                break
+        rows.close()
+        self.connection.execute("DELETE FROM page_text WHERE last_used <= ?", (cutoff,))
+        self.connection.commit()
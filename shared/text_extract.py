@@ -0,0 +1,221 @@
+"""
+Per-page text extraction with interchangeable engines, serially or sharded
+across a process pool
+
+Three engines sit behind the same small interface (`page_count`,
+`pages_text`):
+
+- pdfplumber: best layout reconstruction, pure Python and the slowest
+- pypdf: plain or layout-mode extraction, several times faster
+- pdftotext: poppler's extractor, run once per run of consecutive pages and
+  by far the fastest
+
+The layout analysis of the Python engines doesn't release the GIL, so
+threads don't help; the page list is cut into shards that pool workers
+extract independently, each opening the PDF itself. Results come back in
+page order whatever order the shards finish in, with only a bounded number
+of shards in flight.
+"""
+
+import functools
+import multiprocessing
+import re
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+import pdfplumber
+from pypdf import PdfReader
+from shared.parallel import bounded_map
+
+# Upper bound on pages per shard, so progress stays fine-grained on big documents
+MAX_SHARD_PAGES = 32
+
+
+def page_text(page, layout: bool) -> str:
+    """
+    Text of one pdfplumber page, with or without layout preservation. The
+    page's parsed objects are released afterwards, so memory doesn't grow
+    with the number of pages read from one document.
+    """
+    try:
+        if layout:
+            text = page.extract_text(layout=True)
+        else:
+            text = page.extract_text()
+    finally:
+        page.close()
+    return text or ""
+
+
+class TextEngine(ABC):
+    """An open PDF that text can be extracted from, page by page"""
+
+    name = ""
+
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def page_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def page_text(self, page_index: int, layout: bool) -> str:
+        pass
+
+    def pages_text(self, page_indices: list[int], layout: bool) -> Iterator[str]:
+        """Text of each page in `page_indices`, in that order"""
+        for page_index in page_indices:
+            yield self.page_text(page_index, layout)
+
+
+class PdfplumberEngine(TextEngine):
+    name = "pdfplumber"
+
+    def __init__(self, pdf_path: str):
+        super().__init__(pdf_path)
+        self.pdf = pdfplumber.open(pdf_path)
+
+    def close(self):
+        self.pdf.close()
+
+    def page_count(self) -> int:
+        return len(self.pdf.pages)
+
+    def page_text(self, page_index: int, layout: bool) -> str:
+        return page_text(self.pdf.pages[page_index], layout)
+
+
+class PypdfEngine(TextEngine):
+    name = "pypdf"
+
+    def __init__(self, pdf_path: str):
+        super().__init__(pdf_path)
+        self.reader = PdfReader(pdf_path)
+
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def page_text(self, page_index: int, layout: bool) -> str:
+        mode = "layout" if layout else "plain"
+        return self.reader.pages[page_index].extract_text(extraction_mode=mode) or ""
+
+
+class PdftotextEngine(TextEngine):
+    """poppler's pdftotext; each run of consecutive pages is one process"""
+
+    name = "pdftotext"
+
+    def page_count(self) -> int:
+        result = subprocess.run(
+            ["pdfinfo", self.pdf_path], capture_output=True, text=True, check=True
+        )
+        match = re.search(r"^Pages:\s+(\d+)", result.stdout, re.MULTILINE)
+        if match is None:
+            raise ValueError(f"Could not read the page count of {self.pdf_path}")
+        return int(match.group(1))
+
+    def _run_text(self, first: int, last: int, layout: bool) -> list[str]:
+        """Text of pages first..last (0-based, inclusive); pdftotext ends every page with a form feed"""
+        command = ["pdftotext", "-q", "-enc", "UTF-8", "-f", str(first + 1), "-l", str(last + 1)]
+        if layout:
+            command.append("-layout")
+        result = subprocess.run(command + [self.pdf_path, "-"], capture_output=True, check=True)
+        pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+        pages = pages[:last - first + 1]
+        return pages + [""] * (last - first + 1 - len(pages))
+
+    def page_text(self, page_index: int, layout: bool) -> str:
+        return self._run_text(page_index, page_index, layout)[0]
+
+    def pages_text(self, page_indices: list[int], layout: bool) -> Iterator[str]:
+        start = 0
+        while start < len(page_indices):
+            end = start + 1
+            while (
+                end < len(page_indices)
+                and end - start < MAX_SHARD_PAGES
+                and page_indices[end] == page_indices[end - 1] + 1
+            ):
+                end += 1
+            yield from self._run_text(page_indices[start], page_indices[end - 1], layout)
+            start = end
+
+
+ENGINES: dict[str, type[TextEngine]] = {
+    engine.name: engine for engine in (PdfplumberEngine, PypdfEngine, PdftotextEngine)
+}
+
+
+def resolve_engine(engine: str, layout: bool) -> str:
+    """
+    Engine name to use for a requested one. "auto" keeps pdfplumber when the
+    layout has to be preserved and otherwise picks the fastest available
+    engine.
+    """
+    if engine == "auto":
+        if layout:
+            return PdfplumberEngine.name
+        if shutil.which("pdftotext") and shutil.which("pdfinfo"):
+            return PdftotextEngine.name
+        return PypdfEngine.name
+    if engine not in ENGINES:
+        raise ValueError(f"Unsupported text extraction engine: {engine}")
+    return engine
+
+
+def open_engine(engine: str, pdf_path: str) -> TextEngine:
+    return ENGINES[engine](pdf_path)
+
+
+def extract_shard(pdf_path: str, page_indices: list[int], layout: bool = True, engine: str = "pdfplumber") -> list[str]:
+    """Pool task: open the PDF and extract the text of the given pages"""
+    with open_engine(engine, pdf_path) as document:
+        return list(document.pages_text(page_indices, layout))
+
+
+def extract_pages(
+    pdf_path: str,
+    page_indices: list[int],
+    layout: bool = True,
+    workers: int = 1,
+    engine: str = "pdfplumber",
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield (page index, text) for every page in `page_indices`, in that order.
+    A pool is only started when each worker gets at least MAX_SHARD_PAGES
+    pages, since spawning workers (and importing the engines in each) costs
+    more than extracting a handful of pages serially.
+    """
+    workers = min(workers, len(page_indices) // MAX_SHARD_PAGES)
+    if workers <= 1:
+        with open_engine(engine, pdf_path) as document:
+            yield from zip(page_indices, document.pages_text(page_indices, layout))
+        return
+
+    shard_size = max(1, min(MAX_SHARD_PAGES, -(-len(page_indices) // (workers * 4))))
+    shards = [page_indices[start:start + shard_size] for start in range(0, len(page_indices), shard_size)]
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(shards)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        texts = bounded_map(
+            executor,
+            functools.partial(extract_shard, pdf_path, layout=layout, engine=engine),
+            shards,
+            max_in_flight=workers * 2,
+        )
+        for shard, shard_texts in zip(shards, texts):
+            yield from zip(shard, shard_texts)
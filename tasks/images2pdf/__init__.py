@@ -1,9 +1,11 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from oocana import Context
 from typing import Any
-from tempfile import TemporaryDirectory
 from pypdf import PdfWriter
-from PIL import Image, UnidentifiedImageError
+from shared.incremental_writer import IncrementalWriter
+from shared.parallel import bounded_map
+from shared.pdf_images import add_image_page, load_payload
 
 
 def main(params: dict, context: Context):
@@ -11,6 +13,9 @@ def main(params: dict, context: Context):
     author: str | None = params.get("author")
     image_paths: list[str] = params.get("image_paths", [])
     pdf_file_path: str | None = params.get("pdf_file_path")
+    passthrough: bool = params.get("passthrough") if params.get("passthrough") is not None else True
+    compact_scans: bool = params.get("compact_scans") if params.get("compact_scans") is not None else True
+    workers: int = int(params.get("workers") or os.cpu_count() or 1)
 
     if pdf_file_path is not None:
         if not pdf_file_path.lower().endswith(".pdf"):
@@ -27,32 +32,36 @@ def main(params: dict, context: Context):
     if author is not None:
         metadata["/Author"] = author
 
-    valid_images = []
-    with TemporaryDirectory() as temp_dir:
-        writer = PdfWriter()
-
-        for i, image_path in enumerate(image_paths):
-            try:
-                with Image.open(image_path) as img:
-                    img.verify()
-                valid_images.append(image_path)
-            except (UnidentifiedImageError, IOError):
-                print(f"Skipping non-image file: {image_path}")
-                continue
-
-        for i, image_path in enumerate(valid_images):
-            image = Image.open(image_path).convert("RGB")
-            page_path = os.path.join(temp_dir, f"{i}.pdf")
-            image.save(page_path, "PDF", resolution=100.0)
-            writer.append(page_path)
-            context.report_progress((i + 1) / len(valid_images) * 90.0)
+    writer = PdfWriter()
+
+    with open(pdf_file_path, "wb") as output_file:
+        # Each page's image and content stream are written out as soon as the
+        # page is built, so only the small page dictionaries stay in memory
+        incremental = IncrementalWriter(writer, output_file, deduplicate=False)
+
+        # Validation, decoding and encoding run on a worker pool. Results are
+        # consumed in input order with a bounded number of prepared payloads
+        # in flight, so page order is deterministic and at most that many
+        # images are held at once.
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            payloads = bounded_map(
+                executor,
+                lambda image_path: load_payload(image_path, passthrough, compact_scans),
+                image_paths,
+                max_in_flight=max(1, workers) * 2,
+            )
+            for i, (image_path, payload) in enumerate(zip(image_paths, payloads)):
+                if payload is None:
+                    print(f"Skipping non-image file: {image_path}")
+                else:
+                    add_image_page(writer, payload)
+                    incremental.flush()
+                context.report_progress((i + 1) / len(image_paths) * 90.0)
 
         if metadata:
             writer.add_metadata(metadata)
+        incremental.finish()
 
-        with open(pdf_file_path, "wb") as output_file:
-            writer.write(output_file)
-
-        context.report_progress(100.0)
+    context.report_progress(100.0)
 
     return {"pdf_file_path": pdf_file_path}
@@ -1,9 +1,10 @@
 import os
 from oocana import Context
 from typing import Any
-from tempfile import TemporaryDirectory
-from pypdf import PdfMerger
+from pypdf import PdfWriter
 from PIL import Image, UnidentifiedImageError
+from shared.incremental_writer import IncrementalWriter
+from shared.pdf_images import add_image_page, decoded_payload, passthrough_payload
 
 
 def main(params: dict, context: Context):
@@ -28,28 +29,33 @@ def main(params: dict, context: Context):
         metadata["/Author"] = author
 
     valid_images = []
-    with TemporaryDirectory() as temp_dir:
-        with PdfMerger() as merger:
-            for i, image_path in enumerate(image_paths):
-                try:
-                    with Image.open(image_path) as img:
-                        img.verify()
-                    valid_images.append(image_path)
-                except (UnidentifiedImageError, IOError):
-                    print(f"Skipping non-image file: {image_path}")
-                    continue
-
-            for i, image_path in enumerate(valid_images):
-                image = Image.open(image_path).convert("RGB")
-                page_path = os.path.join(temp_dir, f"{i}.pdf")
-                image.save(page_path, "PDF", resolution=100.0)
-                merger.append(page_path)
-                context.report_progress((i + 1) / len(valid_images) * 90.0)
-
-            if metadata:
-                merger.add_metadata(metadata)
-            merger.write(pdf_file_path)
-
-        context.report_progress(100.0)
+    writer = PdfWriter()
+
+    for image_path in image_paths:
+        try:
+            with Image.open(image_path) as img:
+                img.verify()
+            valid_images.append(image_path)
+        except (UnidentifiedImageError, IOError):
+            print(f"Skipping non-image file: {image_path}")
+            continue
+
+    with open(pdf_file_path, "wb") as output_file:
+        # Pages are written out as they are built, one image in memory at a time
+        incremental = IncrementalWriter(writer, output_file, deduplicate=False)
+        for i, image_path in enumerate(valid_images):
+            payload = passthrough_payload(image_path)
+            if payload is None:
+                with Image.open(image_path) as image:
+                    payload = decoded_payload(image)
+            add_image_page(writer, payload)
+            incremental.flush()
+            context.report_progress((i + 1) / len(valid_images) * 90.0)
+
+        if metadata:
+            writer.add_metadata(metadata)
+        incremental.finish()
+
+    context.report_progress(100.0)
 
     return {"pdf_file_path": pdf_file_path}
@@ -1,14 +1,61 @@
 import os
+import re
+import json
+import math
+import shutil
+import tarfile
+import zipfile
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from oocana import Context
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pypdf import PdfReader
+from PIL import Image
+
+# Output format -> (PIL format name, file extension)
+IMAGE_FORMATS = {
+    "png": ("PNG", "png"),
+    "jpeg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+    "tiff": ("TIFF", "tif"),
+}
+
+# Formats pdftoppm can encode itself, mapped to its output format name
+DIRECT_FORMATS = {
+    "png": "png",
+    "jpeg": "jpeg",
+    "tiff": "tiff",
+}
+
+# pdftoppm names its files "<root>-<page number>.<ext>"
+RENDERED_PAGE_PATTERN = re.compile(r"-(\d+)\.[^.]+$")
 
 
 def main(params: dict, context: Context):
     pdf_path = params.get("pdf_path")
     image_dir = params.get("image_dir")
+    batch_size = int(params.get("batch_size") or 10)
+    dpi = int(params.get("dpi") or 200)
+    image_format = params.get("image_format") or "png"
+    quality = int(params.get("quality") or 85)
+    compression_level = params.get("compression_level")
+    # pdftoppm has no PNG compression setting, an explicit level needs PIL
+    pil_compression = image_format == "png" and compression_level is not None
+    compression_level = int(compression_level) if compression_level is not None else 6
+    workers = int(params.get("workers") or os.cpu_count() or 1)
+    direct_write = params.get("direct_write") if params.get("direct_write") is not None else True
+    tile_size = params.get("tile_size")
+    archive_format = params.get("archive_format") or "none"
 
     if pdf_path is None:
         raise ValueError("pdf_path is required")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    if tile_size is not None and int(tile_size) < 1:
+        raise ValueError("tile_size must be at least 1")
 
     if image_dir is None:
         image_dir = os.path.join(
@@ -17,21 +64,371 @@ def main(params: dict, context: Context):
         )
     os.makedirs(image_dir, exist_ok=True)
 
-    pdf_to_images(pdf_path, image_dir, context)
+    if archive_format == "none":
+        sink = DirectorySink(image_dir)
+    else:
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        sink = ArchiveSink(os.path.join(image_dir, f"{base_name}.{archive_format}"), archive_format)
+
+    save_options = save_options_for(image_format, quality, compression_level)
+    result = {"image_dir": image_dir}
+
+    with sink:
+        if tile_size is not None:
+            manifest_path = pdf_to_tiles(
+                pdf_path,
+                sink,
+                context,
+                tile_size=int(tile_size),
+                dpi=dpi,
+                image_format=image_format,
+                quality=quality,
+                save_options=save_options,
+                workers=max(1, workers),
+                reencode=pil_compression,
+            )
+            # Inside an archive the manifest is only a member (listed in
+            # archive_members), not a file on disk
+            if isinstance(sink, DirectorySink):
+                result["manifest_path"] = manifest_path
+        else:
+            pdf_to_images(
+                pdf_path,
+                sink,
+                context,
+                batch_size=batch_size,
+                dpi=dpi,
+                image_format=image_format,
+                save_options=save_options,
+                workers=max(1, workers),
+                direct_write=direct_write and not pil_compression,
+                quality=quality,
+            )
+
+    if isinstance(sink, ArchiveSink):
+        result["archive_path"] = sink.archive_path
+        result["archive_members"] = sink.members
+
+    return result
+
+
+class DirectorySink:
+    """Collects rendered files as individual files in the output directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.members = []
+        self.staging_dir = None
+
+    def __enter__(self):
+        # Staging lives inside the output directory so moving a finished
+        # file into place is a rename, never a copy
+        self.staging_dir = tempfile.mkdtemp(prefix=".render-", dir=self.directory)
+        return self
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def add(self, path, name):
+        """Move the finished file at `path` to `name`, returning its location"""
+        target = os.path.join(self.directory, name)
+        os.replace(path, target)
+        self.members.append(name)
+        return target
+
+
+class ArchiveSink:
+    """Streams rendered files into a single ZIP or TAR archive as they finish"""
+
+    def __init__(self, archive_path, archive_format):
+        if archive_format not in ("zip", "tar"):
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        self.archive_path = archive_path
+        self.archive_format = archive_format
+        self.members = []
+        self.staging_dir = None
+        self._archive = None
+
+    def __enter__(self):
+        self.staging_dir = tempfile.mkdtemp(prefix=".render-", dir=os.path.dirname(self.archive_path))
+        if self.archive_format == "zip":
+            # Rendered images are already compressed, store them as they are
+            self._archive = zipfile.ZipFile(self.archive_path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(self.archive_path, "w")
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._archive.close()
+        finally:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def add(self, path, name):
+        """Append the finished file at `path` as member `name`, delete it and return the member name"""
+        if self.archive_format == "zip":
+            self._archive.write(path, arcname=name)
+        else:
+            self._archive.add(path, arcname=name)
+        os.remove(path)
+        self.members.append(name)
+        return name
+
+
+def save_options_for(image_format, quality, compression_level):
+    """Map the block's compression inputs onto PIL save() keyword arguments"""
+    if image_format == "png":
+        return {"compress_level": min(max(compression_level, 0), 9)}
+    if image_format in ("jpeg", "webp"):
+        return {"quality": min(max(quality, 1), 100)}
+    return {"compression": "tiff_deflate"}
+
+
+def pdf_to_images(
+    pdf_path,
+    sink,
+    context,
+    batch_size=10,
+    dpi=200,
+    image_format="png",
+    save_options=None,
+    workers=1,
+    direct_write=True,
+    quality=85,
+):
+    if direct_write and image_format in DIRECT_FORMATS:
+        pdf_to_image_files(
+            pdf_path,
+            sink,
+            context,
+            batch_size=batch_size,
+            dpi=dpi,
+            image_format=image_format,
+            quality=quality,
+            workers=workers,
+        )
+        return
+
+    # Render the document in windows of `batch_size` pages so that only one
+    # window of decoded bitmaps is alive at any time, whatever the page count.
+    # Inside a window the page range is split across `workers` pdftoppm
+    # processes, and the encoded files are written by a thread pool (PIL
+    # releases the GIL while encoding).
+    pil_format, extension = IMAGE_FORMATS[image_format]
+    save_options = save_options or {}
+    total_pages = int(pdfinfo_from_path(pdf_path)["Pages"])
+
+    def save(page_number, image):
+        image_path = os.path.join(sink.staging_dir, f"page_{page_number}.{extension}")
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(image_path, pil_format, **save_options)
+        image.close()
+        return image_path
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for first_page in range(1, total_pages + 1, batch_size):
+            last_page = min(first_page + batch_size - 1, total_pages)
+            images = convert_from_path(
+                pdf_path,
+                dpi=dpi,
+                first_page=first_page,
+                last_page=last_page,
+                thread_count=workers,
+            )
+            futures = [
+                executor.submit(save, first_page + offset, image)
+                for offset, image in enumerate(images)
+            ]
+            for offset, future in enumerate(futures):
+                page_number = first_page + offset
+                sink.add(future.result(), f"page_{page_number}.{extension}")
+                context.report_progress(page_number / total_pages * 100)
+
+            # Drop the window before rendering the next one
+            del images, futures
+
+
+def pdftoppm_format_args(image_format, quality=85):
+    """pdftoppm arguments that make it encode `image_format` itself"""
+    if image_format == "jpeg":
+        return ["-jpeg", "-jpegopt", f"quality={min(max(quality, 1), 100)}"]
+    if image_format == "tiff":
+        # Same compression as the PIL path (tiff_deflate)
+        return ["-tiff", "-tiffcompression", "deflate"]
+    return ["-png"]
+
+
+def pdf_to_image_files(
+    pdf_path,
+    sink,
+    context,
+    batch_size=10,
+    dpi=200,
+    image_format="png",
+    quality=85,
+    workers=1,
+):
+    # Fast path: pdftoppm encodes the final files itself into the staging
+    # directory, and we only hand them over to the sink. No page is ever
+    # decoded into (or re-encoded from) a PIL image. Each window of pages is
+    # split across `workers` pdftoppm processes.
+    _, extension = IMAGE_FORMATS[image_format]
+    format_args = pdftoppm_format_args(image_format, quality)
+    output_root = os.path.join(sink.staging_dir, "page")
+    total_pages = int(pdfinfo_from_path(pdf_path)["Pages"])
+
+    for first_page in range(1, total_pages + 1, batch_size):
+        last_page = min(first_page + batch_size - 1, total_pages)
+        pages_per_process = -(-(last_page - first_page + 1) // workers)
+
+        processes = []
+        for start in range(first_page, last_page + 1, pages_per_process):
+            end = min(start + pages_per_process - 1, last_page)
+            args = ["pdftoppm", "-f", str(start), "-l", str(end), "-r", str(dpi), *format_args, pdf_path, output_root]
+            processes.append((args, subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)))
+        for args, process in processes:
+            _, stderr = process.communicate()
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, args, stderr=stderr)
+
+        # pdftoppm names its files "page-<zero-padded page number>.<ext>"
+        rendered = sorted(
+            (int(match.group(1)), name)
+            for name in os.listdir(sink.staging_dir)
+            if name.startswith("page-") and (match := RENDERED_PAGE_PATTERN.search(name))
+        )
+        for page_number, name in rendered:
+            sink.add(os.path.join(sink.staging_dir, name), f"page_{page_number}.{extension}")
+            context.report_progress(page_number / total_pages * 100)
+
+
+def pdf_to_tiles(
+    pdf_path,
+    sink,
+    context,
+    tile_size=1024,
+    dpi=200,
+    image_format="png",
+    quality=85,
+    save_options=None,
+    workers=1,
+    reencode=False,
+):
+    # Every page is cut into a grid of tile_size x tile_size pixel tiles and
+    # each tile is rendered on its own with pdftoppm's crop box (-x/-y/-W/-H),
+    # so a full-page bitmap is never allocated, whatever the page size or DPI.
+    # The grid is described in manifest.json for deep-zoom style consumers.
+    _, extension = IMAGE_FORMATS[image_format]
+    pages = []
+
+    for page_index, page in enumerate(PdfReader(pdf_path).pages):
+        width_pt = float(page.mediabox.width)
+        height_pt = float(page.mediabox.height)
+        if page.rotation % 180 == 90:
+            width_pt, height_pt = height_pt, width_pt
+        width = max(1, math.ceil(width_pt * dpi / 72))
+        height = max(1, math.ceil(height_pt * dpi / 72))
+        columns = math.ceil(width / tile_size)
+        rows = math.ceil(height / tile_size)
+
+        tiles = []
+        for row in range(rows):
+            for column in range(columns):
+                x = column * tile_size
+                y = row * tile_size
+                tiles.append({
+                    "row": row,
+                    "column": column,
+                    "x": x,
+                    "y": y,
+                    "width": min(tile_size, width - x),
+                    "height": min(tile_size, height - y),
+                    "file": f"page_{page_index + 1}_{row}_{column}.{extension}",
+                })
+        pages.append({
+            "page": page_index + 1,
+            "width": width,
+            "height": height,
+            "columns": columns,
+            "rows": rows,
+            "tiles": tiles,
+        })
+
+    jobs = [(page["page"], tile) for page in pages for tile in page["tiles"]]
+
+    def render(job):
+        page_number, tile = job
+        image_path = os.path.join(sink.staging_dir, tile["file"])
+        render_tile(
+            pdf_path,
+            page_number,
+            tile,
+            image_path,
+            dpi=dpi,
+            image_format=image_format,
+            quality=quality,
+            save_options=save_options,
+            reencode=reencode,
+        )
+        return image_path, tile["file"]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for done, (image_path, name) in enumerate(executor.map(render, jobs), start=1):
+            sink.add(image_path, name)
+            context.report_progress(done / len(jobs) * 100)
+
+    manifest_path = os.path.join(sink.staging_dir, "manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump({
+            "dpi": dpi,
+            "tile_size": tile_size,
+            "format": image_format,
+            "pages": pages,
+        }, manifest_file, indent=2)
+
+    return sink.add(manifest_path, "manifest.json")
 
-    return {"image_dir": image_dir}
 
+def render_tile(
+    pdf_path,
+    page_number,
+    tile,
+    image_path,
+    dpi=200,
+    image_format="png",
+    quality=85,
+    save_options=None,
+    reencode=False,
+):
+    """
+    Render one cropped region of a page straight to `image_path` with
+    pdftoppm. With `reencode` the tile is re-saved with PIL's `save_options`
+    even if pdftoppm can write the format (e.g. an explicit PNG compression
+    level).
+    """
+    fmt = DIRECT_FORMATS.get(image_format, "png")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_root = os.path.join(temp_dir, "tile")
+        args = [
+            "pdftoppm",
+            "-f", str(page_number),
+            "-l", str(page_number),
+            "-r", str(dpi),
+            "-x", str(tile["x"]),
+            "-y", str(tile["y"]),
+            "-W", str(tile["width"]),
+            "-H", str(tile["height"]),
+            "-singlefile",
+            *pdftoppm_format_args(fmt, quality),
+        ]
+        subprocess.run(args + [pdf_path, output_root], check=True, capture_output=True)
 
-def pdf_to_images(pdf_path, output_folder, context):
-    # Convert PDF to images
-    images = convert_from_path(pdf_path)
-    total_pages = len(images)
-    percentage = 0
-    # Save each image
-    for i, image in enumerate(images):
-        # Calculate the percentage of the current page
-        percentage = (i + 1) / total_pages * 100
-        # Print or record percentage
-        context.report_progress(percentage)
-        image_path = f"{output_folder}/page_{i + 1}.png"
-        image.save(image_path, "PNG")
\ No newline at end of file
+        rendered_path = f"{output_root}.{IMAGE_FORMATS[fmt][1]}"
+        if fmt == image_format and not reencode:
+            os.replace(rendered_path, image_path)
+        else:
+            # pdftoppm cannot encode this format, convert the (small) tile
+            pil_format, _ = IMAGE_FORMATS[image_format]
+            with Image.open(rendered_path) as image:
+                image.save(image_path, pil_format, **(save_options or {}))
@@ -15,9 +15,8 @@ class Outputs(typing.TypedDict):
 
 from oocana import Context
 from pypdf import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
 from reportlab.lib.colors import HexColor
-import io
+from shared.overlay import Overlay, OverlayEngine
 
 def main(params: Inputs, context: Context) -> dict:
     """
@@ -47,71 +46,25 @@ def main(params: Inputs, context: Context) -> dict:
         if target_page < 0 or target_page >= total_pages:
             raise ValueError(f"Page {page_number} does not exist in PDF")
 
+        engine = OverlayEngine(writer)
+
         # Process each page
         for page_index, page in enumerate(reader.pages):
+            page = writer.add_page(page)
             if page_index == target_page:
                 # Add annotation to target page
                 page_width = float(page.mediabox.width)
                 page_height = float(page.mediabox.height)
 
-                # Create annotation overlay
-                packet = io.BytesIO()
-                can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-
                 # Calculate position
                 x_pos = x_position * page_width
                 y_pos = y_position * page_height
 
-                # Set color
-                try:
-                    hex_color = HexColor(color)
-                    can.setFillColor(hex_color)
-                    can.setStrokeColor(hex_color)
-                except:
-                    # Default to yellow if color parsing fails
-                    can.setFillColor(HexColor("#FFFF00"))
-                    can.setStrokeColor(HexColor("#FFFF00"))
-
-                if annotation_type == "text":
-                    # Text annotation
-                    can.setFont("Helvetica", 12)
-                    can.drawString(x_pos, y_pos, params["annotation_text"])
-
-                elif annotation_type == "highlight":
-                    # Highlight annotation (rectangle)
-                    text_width = len(params["annotation_text"]) * 7  # Approximate width
-                    can.setFillAlpha(0.3)  # Semi-transparent
-                    can.rect(x_pos, y_pos - 2, text_width, 14, fill=1, stroke=0)
-                    can.setFillAlpha(1.0)  # Reset transparency
-                    can.setFillColor(HexColor("#000000"))  # Black text
-                    can.drawString(x_pos, y_pos, params["annotation_text"])
-
-                elif annotation_type == "note":
-                    # Note annotation (circle with text)
-                    can.circle(x_pos, y_pos, 8, fill=1)
-                    can.setFillColor(HexColor("#000000"))  # Black text
-                    can.setFont("Helvetica", 8)
-                    can.drawString(x_pos + 15, y_pos - 3, params["annotation_text"])
-
-                elif annotation_type == "stamp":
-                    # Stamp annotation (bordered rectangle with text)
-                    text_width = len(params["annotation_text"]) * 8
-                    text_height = 20
-                    can.rect(x_pos, y_pos, text_width, text_height, fill=0, stroke=1)
-                    can.setFillColor(HexColor("#000000"))  # Black text
-                    can.setFont("Helvetica-Bold", 10)
-                    can.drawString(x_pos + 5, y_pos + 5, params["annotation_text"])
-                
-                can.save()
-                
-                # Merge annotation with original page
-                packet.seek(0)
-                annotation_pdf = PdfReader(packet)
-                if annotation_pdf.pages:
-                    page.merge_page(annotation_pdf.pages[0])
-            
-            writer.add_page(page)
-        
+                overlay = create_annotation_overlay(
+                    annotation_type, params["annotation_text"], x_pos, y_pos, color
+                )
+                engine.apply(page, overlay)
+
         # Write annotated PDF
         with open(params["output_path"], 'wb') as output_file:
             writer.write(output_file)
@@ -119,4 +72,49 @@ def main(params: Inputs, context: Context) -> dict:
         return {"output_path": params["output_path"]}
         
     except Exception as e:
-        raise Exception(f"Error adding annotation to PDF: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error adding annotation to PDF: {str(e)}")
+
+def create_annotation_overlay(annotation_type, annotation_text, x_pos, y_pos, color):
+    """Draw an annotation as direct content-stream operators"""
+    overlay = Overlay()
+    overlay.set_font("Helvetica", 12)
+
+    # Set color
+    try:
+        hex_color = HexColor(color)
+    except:
+        # Default to yellow if color parsing fails
+        hex_color = HexColor("#FFFF00")
+    overlay.set_fill_color(hex_color.red, hex_color.green, hex_color.blue)
+    overlay.set_stroke_color(hex_color.red, hex_color.green, hex_color.blue)
+
+    if annotation_type == "text":
+        # Text annotation
+        overlay.text(x_pos, y_pos, annotation_text)
+
+    elif annotation_type == "highlight":
+        # Highlight annotation (rectangle)
+        text_width = len(annotation_text) * 7  # Approximate width
+        overlay.set_alpha(fill=0.3)  # Semi-transparent
+        overlay.rect(x_pos, y_pos - 2, text_width, 14, fill=True, stroke=False)
+        overlay.set_alpha(fill=1.0)  # Reset transparency
+        overlay.set_fill_color(0, 0, 0)  # Black text
+        overlay.text(x_pos, y_pos, annotation_text)
+
+    elif annotation_type == "note":
+        # Note annotation (circle with text)
+        overlay.circle(x_pos, y_pos, 8, fill=True, stroke=True)
+        overlay.set_fill_color(0, 0, 0)  # Black text
+        overlay.set_font("Helvetica", 8)
+        overlay.text(x_pos + 15, y_pos - 3, annotation_text)
+
+    elif annotation_type == "stamp":
+        # Stamp annotation (bordered rectangle with text)
+        text_width = len(annotation_text) * 8
+        text_height = 20
+        overlay.rect(x_pos, y_pos, text_width, text_height, fill=False, stroke=True)
+        overlay.set_fill_color(0, 0, 0)  # Black text
+        overlay.set_font("Helvetica-Bold", 10)
+        overlay.text(x_pos + 5, y_pos + 5, annotation_text)
+
+    return overlay
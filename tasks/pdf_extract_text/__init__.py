@@ -5,15 +5,27 @@ class Inputs(typing.TypedDict):
     output_file: str | None
     page_range: str | None
     preserve_formatting: bool | None
+    workers: float | None
+    engine: typing.Literal["auto", "pdfplumber", "pypdf", "pdftotext"] | None
+    use_cache: bool | None
+    cache_size_mb: float | None
 class Outputs(typing.TypedDict):
     markdown_file: typing.NotRequired[str]
     pages_processed: typing.NotRequired[float]
+    cache_hit_rate: typing.NotRequired[float]
 #endregion
 
 from oocana import Context
-import pdfplumber
 import os
+import sqlite3
 import tempfile
+from shared.cache import file_digest
+from shared.text_cache import PageTextCache
+from shared.text_extract import extract_pages, open_engine, resolve_engine
+
+# Failures of the page text cache (unwritable location, locked or corrupt
+# database); the job carries on without the cache
+CACHE_ERRORS = (OSError, sqlite3.Error)
 
 def main(params: Inputs, context: Context) -> dict:
     """
@@ -30,46 +42,22 @@ def main(params: Inputs, context: Context) -> dict:
         # Apply default values for nullable parameters
         page_range = params.get("page_range") or "all"
         preserve_formatting = params.get("preserve_formatting") if params.get("preserve_formatting") is not None else True
+        workers = int(params.get("workers") or 1)
+        engine = resolve_engine(params.get("engine") or "auto", preserve_formatting)
+        use_cache = params.get("use_cache") if params.get("use_cache") is not None else True
+        cache_size_mb = params.get("cache_size_mb") or 256
 
-        extracted_data = []
         pages_processed = 0
 
-        with pdfplumber.open(params["pdf_path"]) as pdf:
-            total_pages = len(pdf.pages)
-
-            # Parse page range
-            if page_range.strip().lower() == "all":
-                page_indices = range(total_pages)
-            else:
-                page_indices = parse_page_range(page_range, total_pages)
-
-            # Extract text from specified pages
-            for page_index in page_indices:
-                if 0 <= page_index < total_pages:
-                    page = pdf.pages[page_index]
-
-                    if preserve_formatting:
-                        # Extract with layout preservation
-                        text = page.extract_text(layout=True)
-                    else:
-                        # Simple text extraction
-                        text = page.extract_text()
-
-                    if text:
-                        extracted_data.append({
-                            "page": page_index + 1,
-                            "text": text.strip()
-                        })
-
-                    pages_processed += 1
+        with open_engine(engine, params["pdf_path"]) as document:
+            total_pages = document.page_count()
 
-        # Generate markdown content
-        markdown_lines = []
-        for item in extracted_data:
-            markdown_lines.append(f"## Page {item['page']}\n")
-            markdown_lines.append(f"{item['text']}\n")
-
-        markdown_content = "\n".join(markdown_lines)
+        # Parse page range
+        if page_range.strip().lower() == "all":
+            page_indices = range(total_pages)
+        else:
+            page_indices = parse_page_range(page_range, total_pages)
+        page_indices = [page_index for page_index in page_indices if 0 <= page_index < total_pages]
 
         # Determine output file path
         if params.get("output_file"):
@@ -79,18 +67,105 @@ def main(params: Inputs, context: Context) -> dict:
             pdf_basename = os.path.splitext(os.path.basename(params["pdf_path"]))[0]
             output_path = os.path.join(tempfile.gettempdir(), f"{pdf_basename}_extracted.md")
 
-        # Save to markdown file
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
+        # Pages already extracted (same content, engine and layout flag) come
+        # from the page text cache; only the others are extracted
+        cache = None
+        file_hash = None
+        cached_pages = set()
+        if use_cache:
+            try:
+                cache = PageTextCache(int(cache_size_mb * 1024 * 1024))
+                file_hash = file_digest(params["pdf_path"])
+                cached_pages = cache.cached_pages(file_hash, engine, preserve_formatting)
+            except CACHE_ERRORS:
+                # No usable cache, just extract every page
+                discard_cache(cache)
+                cache = None
+                cached_pages = set()
+        missing_pages = [page_index for page_index in page_indices if page_index not in cached_pages]
+        cache_hits = len(page_indices) - len(missing_pages)
+
+        # Extract text from the missing pages; with several workers, shards
+        # of pages are extracted in parallel and come back in page order
+        extracted = extract_pages(
+            params["pdf_path"], missing_pages,
+            layout=preserve_formatting, workers=max(1, workers), engine=engine,
+        )
+
+        try:
+            # Stream markdown to the file as pages are extracted, so no more than
+            # one page of text is held at a time. Sections are separated by a
+            # blank line: "## Page N\n", "\n", text, "\n".
+            with open(output_path, 'w', encoding='utf-8') as f:
+                sections_written = 0
+
+                for page_index in page_indices:
+                    if page_index in cached_pages:
+                        text = None
+                        if cache is not None:
+                            try:
+                                text = cache.get(file_hash, page_index, engine, preserve_formatting)
+                            except CACHE_ERRORS:
+                                discard_cache(cache)
+                                cache = None
+                        if text is None:
+                            # Evicted by a concurrent run since the lookup,
+                            # or the cache became unusable
+                            cache_hits -= 1
+                            _, text = next(extract_pages(
+                                params["pdf_path"], [page_index], layout=preserve_formatting, engine=engine
+                            ))
+                    else:
+                        _, text = next(extracted)
+                        if cache is not None:
+                            try:
+                                cache.put(file_hash, page_index, engine, preserve_formatting, text)
+                            except CACHE_ERRORS:
+                                discard_cache(cache)
+                                cache = None
+
+                    if text:
+                        if sections_written:
+                            f.write("\n")
+                        f.write(f"## Page {page_index + 1}\n\n{text.strip()}\n")
+                        sections_written += 1
+
+                    if cache is not None:
+                        # Short transactions, so concurrent runs aren't locked out
+                        try:
+                            cache.commit()
+                        except CACHE_ERRORS:
+                            discard_cache(cache)
+                            cache = None
+
+                    pages_processed += 1
+                    context.report_progress(pages_processed / len(page_indices) * 100)
+        finally:
+            extracted.close()
+            if cache is not None:
+                try:
+                    cache.evict()
+                    cache.close()
+                except CACHE_ERRORS:
+                    discard_cache(cache)
 
         return {
             "markdown_file": output_path,
-            "pages_processed": pages_processed
+            "pages_processed": pages_processed,
+            "cache_hit_rate": cache_hits / len(page_indices) if page_indices else 0.0,
         }
 
     except Exception as e:
         raise Exception(f"Error extracting text from PDF: {str(e)}")
 
+def discard_cache(cache):
+    """Close a failing page text cache without raising"""
+    if cache is not None:
+        try:
+            cache.connection.close()
+        except CACHE_ERRORS:
+            pass
+
 def parse_page_range(range_str, total_pages):
     """Parse page range string like "1-3,5" into list of page indices (0-based)"""
     pages = []
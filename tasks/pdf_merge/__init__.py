@@ -5,18 +5,34 @@ class Inputs(typing.TypedDict):
     output_path: str
     preserve_bookmarks: bool | None
     add_page_numbers: bool | None
+    page_number_position: typing.Literal["bottom-center", "bottom-left", "bottom-right", "top-center", "top-left", "top-right"] | None
+    page_number_format: str | None
+    page_number_start: float | None
+    deduplicate: bool | None
+    streaming: bool | None
 class Outputs(typing.TypedDict):
     output_path: typing.NotRequired[str]
     total_pages: typing.NotRequired[float]
     file_count: typing.NotRequired[float]
+    bytes_saved: typing.NotRequired[float]
 #endregion
 
 from oocana import Context
 from pypdf import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import io
+from shared.dedupe import deduplicate_objects
+from shared.incremental_writer import IncrementalWriter
+from shared.outline import add_outline, outline_tree
+from shared.overlay import Overlay, OverlayEngine
 import os
+import string
+
+# Distance of page numbers from the page edges, in points
+PAGE_NUMBER_MARGIN = 20
+PAGE_NUMBER_FONT_SIZE = 10
+PAGE_NUMBER_POSITIONS = {
+    "bottom-center", "bottom-left", "bottom-right",
+    "top-center", "top-left", "top-right",
+}
 
 def main(params: Inputs, context: Context) -> dict:
     """
@@ -36,88 +52,121 @@ def main(params: Inputs, context: Context) -> dict:
         # Apply default values for nullable parameters
         preserve_bookmarks = params.get("preserve_bookmarks") if params.get("preserve_bookmarks") is not None else True
         add_page_numbers = params.get("add_page_numbers") if params.get("add_page_numbers") is not None else False
+        page_number_position = params.get("page_number_position") or "bottom-center"
+        page_number_format = params.get("page_number_format") or "{n}"
+        page_number_start = int(params.get("page_number_start") if params.get("page_number_start") is not None else 1)
+        deduplicate = params.get("deduplicate") if params.get("deduplicate") is not None else True
+        streaming = params.get("streaming") if params.get("streaming") is not None else False
+
+        if page_number_position not in PAGE_NUMBER_POSITIONS:
+            raise ValueError(f"Unsupported page number position: {page_number_position}")
+        try:
+            page_number_format.format(n=1, total=1)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"Invalid page number format {page_number_format!r}: {e}")
+
+        pdf_paths = [pdf_path for pdf_path in params["pdf_files"] if os.path.exists(pdf_path)]
+
+        # {total} is the last page number, so "{n} / {total}" ends at "x / x".
+        # Counting it means parsing every input an extra time, so it is only
+        # done when the format uses it.
+        last_page_number = page_number_start - 1
+        uses_total = any(
+            field_name == "total"
+            for _, field_name, _, _ in string.Formatter().parse(page_number_format)
+        )
+        if add_page_numbers and uses_total:
+            last_page_number += sum(len(PdfReader(pdf_path).pages) for pdf_path in pdf_paths)
 
-        # Initialize PDF writer
+        # Initialize PDF writer; every page number shares the same font resource
         writer = PdfWriter()
+        engine = OverlayEngine(writer)
         total_pages = 0
+        bookmarks = []
 
-        # Process each input PDF
-        for file_index, pdf_path in enumerate(params["pdf_files"]):
-            if not os.path.exists(pdf_path):
-                continue
-
-            reader = PdfReader(pdf_path)
-            file_pages = len(reader.pages)
-
-            # Add all pages from current PDF
-            for page_index, page in enumerate(reader.pages):
-                # Add page numbers if requested
-                if add_page_numbers:
-                    current_page_num = total_pages + page_index + 1
-                    page = add_page_number(page, current_page_num)
-
-                writer.add_page(page)
-
-            # Preserve bookmarks if requested
-            if preserve_bookmarks and reader.outline:
-                try:
-                    # Add bookmarks with offset
-                    for bookmark in reader.outline:
-                        if isinstance(bookmark, list):
-                            # Handle nested bookmarks
-                            for sub_bookmark in bookmark:
-                                writer.add_outline_item(
-                                    sub_bookmark.title, 
-                                    total_pages + sub_bookmark.page.idnum
-                                )
-                        else:
-                            writer.add_outline_item(
-                                bookmark.title, 
-                                total_pages + bookmark.page.idnum
-                            )
-                except Exception as e:
-                    # Continue if bookmark processing fails
-                    pass
-            
-            total_pages += file_pages
-        
-        # Write merged PDF
         with open(params["output_path"], 'wb') as output_file:
-            writer.write(output_file)
-        
+            # In streaming mode each input's objects are written out as soon
+            # as the input is done, so only one input is held in memory
+            incremental = IncrementalWriter(writer, output_file, deduplicate) if streaming else None
+
+            # Process each input PDF, one reader at a time
+            for pdf_path in pdf_paths:
+                reader = PdfReader(pdf_path)
+                file_pages = len(reader.pages)
+
+                # Add all pages from current PDF
+                for page_index, page in enumerate(reader.pages):
+                    page = writer.add_page(page)
+
+                    # Add page numbers if requested
+                    if add_page_numbers:
+                        label = page_number_format.format(
+                            n=page_number_start + total_pages + page_index,
+                            total=last_page_number,
+                        )
+                        add_page_number(engine, page, label, page_number_position)
+
+                # Collect bookmarks if requested; they are added once all pages are in
+                if preserve_bookmarks and reader.outline:
+                    try:
+                        bookmarks.append((total_pages, outline_tree(reader)))
+                    except Exception as e:
+                        # Continue if bookmark processing fails
+                        pass
+
+                total_pages += file_pages
+
+                if incremental is not None:
+                    # Page number fonts and streams may have been merged into
+                    # identical objects of this input
+                    engine.remap(incremental.flush())
+                    writer.reset_translation(reader)
+                del reader
+
+            # Bookmarks keep their nesting, shifted by the pages merged before their file
+            for page_offset, nodes in bookmarks:
+                add_outline(writer, nodes, page_offset)
+
+            if incremental is not None:
+                incremental.finish()
+                bytes_saved = incremental.bytes_saved
+            else:
+                # Write each font, image and content stream shared by several inputs once
+                bytes_saved = 0
+                if deduplicate:
+                    _, bytes_saved = deduplicate_objects(writer)
+
+                # Write merged PDF
+                writer.write(output_file)
+
         return {
             "output_path": params["output_path"],
             "total_pages": total_pages,
-            "file_count": len([f for f in params["pdf_files"] if os.path.exists(f)])
+            "file_count": len(pdf_paths),
+            "bytes_saved": bytes_saved,
         }
         
     except Exception as e:
         raise Exception(f"Error merging PDFs: {str(e)}")
 
-def add_page_number(page, page_num):
-    """Add page number to a PDF page"""
-    try:
-        page_width = float(page.mediabox.width)
-        page_height = float(page.mediabox.height)
-        
-        # Create page number overlay
-        packet = io.BytesIO()
-        can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-        
-        # Draw page number at bottom center
-        can.setFont("Helvetica", 10)
-        can.drawCentredText(page_width / 2, 20, str(page_num))
-        can.save()
-        
-        # Move to the beginning of the BytesIO buffer
-        packet.seek(0)
-        page_num_pdf = PdfReader(packet)
-        
-        # Merge page number with original page
-        if page_num_pdf.pages:
-            page.merge_page(page_num_pdf.pages[0])
-        
-        return page
-    except:
-        # Return original page if page numbering fails
-        return page
\ No newline at end of file
+def add_page_number(engine, page, label, position="bottom-center"):
+    """Draw a page number label onto a page already added to the engine's writer"""
+    box = page.mediabox
+    vertical, horizontal = position.split("-")
+
+    if horizontal == "left":
+        x, align = float(box.left) + PAGE_NUMBER_MARGIN, "left"
+    elif horizontal == "right":
+        x, align = float(box.right) - PAGE_NUMBER_MARGIN, "right"
+    else:
+        x, align = (float(box.left) + float(box.right)) / 2, "center"
+
+    if vertical == "top":
+        y = float(box.top) - PAGE_NUMBER_MARGIN - PAGE_NUMBER_FONT_SIZE
+    else:
+        y = float(box.bottom) + PAGE_NUMBER_MARGIN
+
+    overlay = Overlay()
+    overlay.set_font("Helvetica", PAGE_NUMBER_FONT_SIZE)
+    overlay.text(x, y, label, align=align)
+    engine.apply(page, overlay)
@@ -3,10 +3,13 @@ import typing
 class Inputs(typing.TypedDict):
     pdf_path: str
     output_dir: str
-    split_mode: typing.Literal["single_pages", "page_ranges", "bookmarks", "equal_parts"]
+    split_mode: typing.Literal["single_pages", "page_ranges", "bookmarks", "equal_parts", "max_bytes"]
     page_ranges: str | None
     pages_per_part: float | None
+    max_bytes: float | None
     filename_prefix: str | None
+    workers: float | None
+    prune_resources: bool | None
 class Outputs(typing.TypedDict):
     output_files: typing.NotRequired[list[str]]
     files_created: typing.NotRequired[float]
@@ -14,6 +17,8 @@ class Outputs(typing.TypedDict):
 
 from oocana import Context
 from pypdf import PdfReader, PdfWriter
+from shared.outline import outline_page_indices, outline_tree
+from shared.split_parts import plan_size_parts, write_parts
 import os
 import re
 
@@ -41,23 +46,19 @@ def main(params: Inputs, context: Context) -> dict:
 
         # Apply default values for nullable fields
         pages_per_part = int(params.get("pages_per_part") or 10)
+        max_bytes = int(params.get("max_bytes") or 10 * 1024 * 1024)
         filename_prefix = params.get("filename_prefix") or "page"
+        workers = int(params.get("workers") or 1)
+        prune_resources = params.get("prune_resources") if params.get("prune_resources") is not None else True
 
-        output_files = []
+        # Plan every part first (pages plus filename), then write them all
+        parts = []
 
         if params["split_mode"] == "single_pages":
             # Split into individual pages
             for page_num in range(total_pages):
-                writer = PdfWriter()
-                writer.add_page(reader.pages[page_num])
-
                 filename = f"{filename_prefix}_{page_num + 1:03d}.pdf"
-                output_path = os.path.join(params["output_dir"], filename)
-
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-
-                output_files.append(output_path)
+                parts.append(([page_num], filename))
 
         elif params["split_mode"] == "page_ranges":
             # Split by specified page ranges
@@ -67,65 +68,51 @@ def main(params: Inputs, context: Context) -> dict:
             ranges = parse_page_ranges(params["page_ranges"], total_pages)
 
             for range_index, (start, end) in enumerate(ranges):
-                writer = PdfWriter()
-
-                for page_num in range(start - 1, end):
-                    if 0 <= page_num < total_pages:
-                        writer.add_page(reader.pages[page_num])
-
+                pages = [page_num for page_num in range(start - 1, end) if 0 <= page_num < total_pages]
                 filename = f"{filename_prefix}_range_{range_index + 1}_{start}-{end}.pdf"
-                output_path = os.path.join(params["output_dir"], filename)
-
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-
-                output_files.append(output_path)
+                parts.append((pages, filename))
 
         elif params["split_mode"] == "bookmarks":
             # Split by bookmarks
             if not reader.outline:
                 raise ValueError("PDF has no bookmarks to split by")
 
-            bookmark_pages = extract_bookmark_pages(reader.outline)
+            bookmark_pages = extract_bookmark_pages(reader)
             bookmark_pages.append(total_pages)  # Add final page
 
             for i in range(len(bookmark_pages) - 1):
                 start_page = bookmark_pages[i]
                 end_page = bookmark_pages[i + 1]
 
-                writer = PdfWriter()
-                for page_num in range(start_page, end_page):
-                    if 0 <= page_num < total_pages:
-                        writer.add_page(reader.pages[page_num])
-
+                pages = [page_num for page_num in range(start_page, end_page) if 0 <= page_num < total_pages]
                 filename = f"{filename_prefix}_bookmark_{i + 1}.pdf"
-                output_path = os.path.join(params["output_dir"], filename)
-
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-
-                output_files.append(output_path)
+                parts.append((pages, filename))
 
         elif params["split_mode"] == "equal_parts":
             # Split into equal parts
-            part_num = 1
-
-            for start_page in range(0, total_pages, pages_per_part):
-                writer = PdfWriter()
+            for part_index, start_page in enumerate(range(0, total_pages, pages_per_part)):
                 end_page = min(start_page + pages_per_part, total_pages)
+                filename = f"{filename_prefix}_part_{part_index + 1:02d}.pdf"
+                parts.append((list(range(start_page, end_page)), filename))
+
+        elif params["split_mode"] == "max_bytes":
+            # Split into parts that stay under a size limit, sized from the
+            # objects each page pulls in rather than by writing trial files
+            for part_index, pages in enumerate(plan_size_parts(reader, max_bytes, prune_resources)):
+                filename = f"{filename_prefix}_part_{part_index + 1:02d}.pdf"
+                parts.append((pages, filename))
+
+        # Parts are independent, so they are written concurrently when
+        # workers > 1; output_files keeps the planned order either way
+        output_files = write_parts(
+            params["pdf_path"],
+            reader,
+            [(pages, os.path.join(params["output_dir"], filename)) for pages, filename in parts],
+            workers=max(1, workers),
+            prune=prune_resources,
+            progress=lambda done, total: context.report_progress(done / total * 100),
+        )
 
-                for page_num in range(start_page, end_page):
-                    writer.add_page(reader.pages[page_num])
-
-                filename = f"{filename_prefix}_part_{part_num:02d}.pdf"
-                output_path = os.path.join(params["output_dir"], filename)
-
-                with open(output_path, 'wb') as output_file:
-                    writer.write(output_file)
-
-                output_files.append(output_path)
-                part_num += 1
-        
         return {
             "output_files": output_files,
             "files_created": len(output_files)
@@ -158,21 +145,6 @@ def parse_page_ranges(ranges_str, total_pages):
     
     return ranges
 
-def extract_bookmark_pages(outline, pages=None):
-    """Extract page numbers from PDF bookmarks"""
-    if pages is None:
-        pages = []
-    
-    for item in outline:
-        if isinstance(item, list):
-            # Nested bookmarks
-            extract_bookmark_pages(item, pages)
-        else:
-            try:
-                page_num = item.page.idnum
-                if page_num not in pages:
-                    pages.append(page_num)
-            except:
-                pass
-    
-    return sorted(pages)
\ No newline at end of file
+def extract_bookmark_pages(reader):
+    """Extract the 0-based page indices bookmarks point to, nested bookmarks included"""
+    return outline_page_indices(outline_tree(reader))
@@ -12,19 +12,21 @@ class Inputs(typing.TypedDict):
     font_size: float | None
     rotation: float | None
     color: str | None
+    font_dir: str | None
+    share_overlay: bool | None
 class Outputs(typing.TypedDict):
     output_path: typing.NotRequired[str]
 #endregion
 
 from oocana import Context
 from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
 from reportlab.lib.colors import HexColor
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from pypdf import PdfReader, PdfWriter
 from PIL import Image
+from shared.cache import cache_dir, cache_key, file_digest, write_atomic
+from shared.fonts import resolve_font
+from shared.overlay import Overlay, OverlayEngine, can_encode
+from shared.pdf_images import flate_payloads
 import io
 import os
 
@@ -48,127 +50,65 @@ def main(params: Inputs, context: Context) -> dict:
         font_size = params.get("font_size") if params.get("font_size") is not None else 36
         rotation = params.get("rotation") if params.get("rotation") is not None else 45
         color = params.get("color") or "#B8B8B8"
+        share_overlay = params.get("share_overlay") if params.get("share_overlay") is not None else True
 
         # Read input PDF
         reader = PdfReader(params["pdf_path"])
         writer = PdfWriter()
 
+        options = {
+            "watermark_text": params.get("watermark_text"),
+            "watermark_image": params.get("watermark_image"),
+            "position_x": position_x,
+            "position_y": position_y,
+            "opacity": opacity,
+            "font_size": font_size,
+            "rotation": rotation,
+            "color": color,
+            "font_dirs": [params.get("font_dir")] if params.get("font_dir") else [],
+        }
+
+        # The overlay only depends on the page geometry (the other parameters
+        # are fixed for the whole job), so it is built once per distinct
+        # page size instead of once per page
+        overlays = {}
+        # Shared mode: each overlay is written once as a Form XObject that
+        # every page of that size draws with a `Do` operator
+        forms = {}
+        engine = OverlayEngine(writer)
+
+        # Background places the watermark underneath the content,
+        # foreground on top of it
+        over = layer != "background"
+
         # Process each page
-        for page_num, page in enumerate(reader.pages):
+        for page in reader.pages:
             page_width = float(page.mediabox.width)
             page_height = float(page.mediabox.height)
+            overlay_key = (round(page_width, 3), round(page_height, 3), page.rotation)
 
-            # Create watermark overlay
-            packet = io.BytesIO()
-            can = canvas.Canvas(packet, pagesize=(page_width, page_height))
-
-            # Calculate position
-            x_pos = position_x * page_width
-            y_pos = position_y * page_height
-
-            if params.get("watermark_text") and params["watermark_text"].strip():
-                # Text watermark
-                can.setFillAlpha(opacity)
-                can.setStrokeAlpha(opacity)
-                can.setFillColor(HexColor(color))
-
-                # Register and use font that supports Unicode/CJK
-                try:
-                    # Try to register fonts that support Chinese, Japanese, Korean
-                    # Format: (path, subfontIndex) - subfontIndex is for TTC files
-                    font_configs = [
-                        ('/usr/share/fonts/truetype/wqy/wqy-microhei.ttc', 0),  # WenQuanYi Micro Hei (Linux)
-                        ('/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc', 0),    # WenQuanYi Zen Hei (Linux)
-                        ('/System/Library/Fonts/PingFang.ttc', 0),               # macOS
-                        ('C:\\Windows\\Fonts\\msyh.ttc', 0),                     # Windows - Microsoft YaHei
-                        ('C:\\Windows\\Fonts\\simsun.ttc', 0),                   # Windows - SimSun
-                    ]
-
-                    font_registered = False
-                    for font_path, subfont_idx in font_configs:
-                        if os.path.exists(font_path):
-                            try:
-                                pdfmetrics.registerFont(TTFont('CJKFont', font_path, subfontIndex=subfont_idx))
-                                can.setFont("CJKFont", font_size)
-                                font_registered = True
-                                break
-                            except:
-                                continue
-
-                    if not font_registered:
-                        # Fallback to Helvetica if no CJK font found
-                        can.setFont("Helvetica", font_size)
-                except:
-                    can.setFont("Helvetica", font_size)
-
-                # Rotate and draw text
-                can.translate(x_pos, y_pos)
-                can.rotate(rotation)
-                can.drawCentredString(0, 0, params["watermark_text"])
-
-            elif params.get("watermark_image") and os.path.exists(params["watermark_image"]):
-                # Image watermark with transparency support
-                img = Image.open(params["watermark_image"])
-
-                # Convert to RGBA if not already
-                if img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-
-                # Apply opacity to image
-                if opacity < 1.0:
-                    alpha = img.split()[3] if img.mode == 'RGBA' else Image.new('L', img.size, 255)
-                    alpha = alpha.point(lambda p: int(p * opacity))
-                    img.putalpha(alpha)
-
-                img_width, img_height = img.size
-
-                # Scale image to reasonable size
-                max_size = min(page_width, page_height) * 0.3
-                if img_width > max_size or img_height > max_size:
-                    ratio = min(max_size / img_width, max_size / img_height)
-                    new_width = int(img_width * ratio)
-                    new_height = int(img_height * ratio)
-                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                else:
-                    new_width, new_height = img_width, img_height
-
-                # Save processed image to BytesIO
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-
-                # Draw image with rotation and transparency
-                can.saveState()
-                can.translate(x_pos, y_pos)
-                can.rotate(rotation)
-                can.drawImage(
-                    ImageReader(img_buffer),
-                    -new_width/2, -new_height/2,
-                    new_width, new_height,
-                    mask='auto'
-                )
-                can.restoreState()
-
-            can.save()
-
-            # Move to the beginning of the BytesIO buffer
-            packet.seek(0)
-            watermark_pdf = PdfReader(packet)
-
-            # Merge watermark with original page
-            if watermark_pdf.pages:
-                watermark_page = watermark_pdf.pages[0]
-                if layer == "background":
-                    # Place watermark underneath content
-                    watermark_page.merge_page(page)
-                    writer.add_page(watermark_page)
-                else:
-                    # Place watermark on top of content (foreground)
-                    page.merge_page(watermark_page)
-                    writer.add_page(page)
+            if overlay_key not in overlays:
+                overlays[overlay_key] = create_watermark_overlay(page_width, page_height, options)
+            watermark = overlays[overlay_key]
+
+            if watermark is None:
+                writer.add_page(page)
+            elif share_overlay:
+                if overlay_key not in forms:
+                    if isinstance(watermark, Overlay):
+                        form_ref = engine.form_xobject(watermark, page_width, page_height)
+                    else:
+                        form_ref = engine.form_from_page(watermark, page_width, page_height)
+                    forms[overlay_key] = (f"/OOWatermark{len(forms)}", form_ref)
+                name, form_ref = forms[overlay_key]
+                engine.stamp_form(writer.add_page(page), name, form_ref, over=over)
+            elif isinstance(watermark, Overlay):
+                engine.apply(writer.add_page(page), watermark, over=over)
             else:
+                # Merge watermark with original page
+                page.merge_page(watermark, over=over)
                 writer.add_page(page)
-        
+
         # Determine output path
         output_path = params.get("output_path")
         if not output_path:
@@ -190,4 +130,127 @@ def main(params: Inputs, context: Context) -> dict:
         return {"output_path": output_path}
         
     except Exception as e:
-        raise Exception(f"Error adding watermark to PDF: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error adding watermark to PDF: {str(e)}")
+
+def create_watermark_overlay(page_width, page_height, options):
+    """
+    Build the watermark for one page size. Returns an Overlay drawn with
+    direct content-stream operators, or a reportlab-rendered page when the
+    text needs an embedded (e.g. CJK) font, or None if there is nothing to draw.
+    """
+    watermark_text = options["watermark_text"]
+    watermark_image = options["watermark_image"]
+    opacity = options["opacity"]
+    rotation = options["rotation"]
+
+    # Calculate position
+    x_pos = options["position_x"] * page_width
+    y_pos = options["position_y"] * page_height
+
+    if watermark_text and watermark_text.strip():
+        if options["font_dirs"] or not can_encode(watermark_text):
+            return render_text_watermark_page(page_width, page_height, x_pos, y_pos, options)
+
+        # Text watermark in a standard font. Text is drawn opaque, as it
+        # always has been (reportlab's setFillColor reset the fill alpha);
+        # opacity only applies to image watermarks
+        hex_color = HexColor(options["color"])
+        overlay = Overlay()
+        overlay.set_fill_color(hex_color.red, hex_color.green, hex_color.blue)
+        overlay.set_font("Helvetica", options["font_size"])
+
+        # Rotate and draw text
+        overlay.translate(x_pos, y_pos)
+        overlay.rotate(rotation)
+        overlay.text(0, 0, watermark_text, align="center")
+        return overlay
+
+    if watermark_image and os.path.exists(watermark_image):
+        # Image watermark with transparency support, preprocessed once per
+        # target size and cached on disk across jobs
+        max_size = min(page_width, page_height) * 0.3
+        img_data, new_width, new_height = prepare_watermark_image(watermark_image, opacity, max_size)
+        with Image.open(io.BytesIO(img_data)) as img:
+            payload, smask = flate_payloads(img)
+
+        # Draw image with rotation and transparency
+        overlay = Overlay()
+        overlay.translate(x_pos, y_pos)
+        overlay.rotate(rotation)
+        overlay.image(payload, -new_width/2, -new_height/2, new_width, new_height, smask=smask)
+        return overlay
+
+    return None
+
+
+def render_text_watermark_page(page_width, page_height, x_pos, y_pos, options):
+    """Render a text watermark with reportlab, which embeds the Unicode font it needs"""
+    packet = io.BytesIO()
+    can = canvas.Canvas(packet, pagesize=(page_width, page_height))
+
+    # Opaque, like the standard-font path in create_watermark_overlay
+    can.setFillColor(HexColor(options["color"]))
+
+    # Use a font that supports Unicode/CJK, discovered and registered
+    # once per process
+    can.setFont(resolve_font(options["font_dirs"]), options["font_size"])
+
+    # Rotate and draw text
+    can.translate(x_pos, y_pos)
+    can.rotate(options["rotation"])
+    can.drawCentredString(0, 0, options["watermark_text"])
+    can.save()
+
+    # Move to the beginning of the BytesIO buffer
+    packet.seek(0)
+    watermark_pdf = PdfReader(packet)
+    return watermark_pdf.pages[0] if watermark_pdf.pages else None
+
+
+def prepare_watermark_image(image_path, opacity, max_size):
+    """
+    Apply opacity and scale a watermark image to fit `max_size`, returning
+    (PNG bytes, width, height). Results are cached on disk keyed by the
+    image content, opacity and target size, so recurring logos skip this.
+    """
+    try:
+        cache_path = os.path.join(
+            cache_dir("watermark-images"),
+            cache_key(file_digest(image_path), f"{opacity:.4f}", f"{max_size:.2f}") + ".png",
+        )
+    except OSError:
+        # No usable cache location, just preprocess
+        cache_path = None
+
+    if cache_path is not None and os.path.exists(cache_path):
+        with open(cache_path, "rb") as cache_file:
+            data = cache_file.read()
+        with Image.open(io.BytesIO(data)) as cached:
+            return data, cached.width, cached.height
+
+    with Image.open(image_path) as source:
+        # Convert to RGBA if not already
+        img = source.convert('RGBA')
+
+    # Apply opacity to the alpha band through a lookup table, in one pass
+    # over the band rather than per pixel
+    if opacity < 1.0:
+        alpha = img.getchannel('A').point([int(p * opacity) for p in range(256)])
+        img.putalpha(alpha)
+
+    img_width, img_height = img.size
+
+    # Scale image to reasonable size
+    if img_width > max_size or img_height > max_size:
+        ratio = min(max_size / img_width, max_size / img_height)
+        img = img.resize((int(img_width * ratio), int(img_height * ratio)), Image.Resampling.LANCZOS)
+
+    img_buffer = io.BytesIO()
+    img.save(img_buffer, format='PNG')
+    data = img_buffer.getvalue()
+    if cache_path is not None:
+        try:
+            write_atomic(cache_path, data)
+        except OSError:
+            pass
+    return data, img.width, img.height